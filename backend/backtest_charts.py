@@ -0,0 +1,75 @@
+# backtest_charts.py
+import os
+import threading
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from performance_metrics import drawdown_series
+
+RESULTS_DIR = "backtest_results"
+
+# Evita que dos peticiones rendericen el mismo gráfico a la vez
+_render_lock = threading.Lock()
+
+
+def result_paths(symbol, asset_type, model_type, run_id):
+    """Rutas (serie .npz, gráfico .png) de un resultado de backtesting"""
+    base = os.path.join(RESULTS_DIR, f"{symbol.replace('/', '-')}_{asset_type}_{model_type}_{run_id}")
+    return f"{base}.npz", f"{base}.png"
+
+
+def save_backtest_series(path, dates, portfolio_values, initial_balance, title):
+    """Guardar la curva de capital de forma compacta para poder dibujarla más tarde"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez_compressed(
+        path,
+        dates=np.asarray(dates, dtype='datetime64[s]').astype(np.int64),
+        values=np.asarray(portfolio_values, dtype=np.float64),
+        initial_balance=np.float64(initial_balance),
+        title=np.str_(title)
+    )
+    return path
+
+
+def render_backtest_chart(series_path, chart_path):
+    """Dibujar el gráfico de un backtesting con el backend Agg y la API orientada a objetos (sin pyplot)"""
+    with np.load(series_path) as series:
+        dates = series['dates'].astype('datetime64[s]')
+        values = series['values']
+        initial_balance = float(series['initial_balance'])
+        title = str(series['title'])
+
+    fig = Figure(figsize=(12, 10))
+    FigureCanvasAgg(fig)
+    ax1, ax2 = fig.subplots(2, 1)
+
+    # Gráfico del valor del portafolio
+    ax1.plot(dates, values, label='Valor del Portafolio')
+    ax1.axhline(y=initial_balance, color='r', linestyle='--', label='Balance Inicial')
+    ax1.set_title(title)
+    ax1.set_ylabel('Valor ($)')
+    ax1.legend()
+    ax1.grid(True)
+
+    # Gráfico de drawdown
+    ax2.fill_between(dates, drawdown_series(values), 0, color='red', alpha=0.3)
+    ax2.set_title('Drawdown')
+    ax2.set_ylabel('Drawdown (%)')
+    ax2.set_xlabel('Fecha')
+    ax2.grid(True)
+
+    fig.tight_layout()
+
+    # Escribir en un fichero temporal y renombrar para no servir PNG a medias
+    tmp_path = f"{chart_path}.tmp"
+    fig.savefig(tmp_path, format='png')
+    os.replace(tmp_path, chart_path)
+    return chart_path
+
+
+def get_or_render_chart(series_path, chart_path):
+    """Devolver la ruta del gráfico, dibujándolo solo la primera vez que se pide"""
+    with _render_lock:
+        if not os.path.exists(chart_path):
+            render_backtest_chart(series_path, chart_path)
+    return chart_path
@@ -1,42 +1,86 @@
 # backtesting.py
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-import yfinance as yf
-import ccxt
-from prediction_model import TradingPredictor
+from prediction_model import TradingPredictor, classify_change
+from market_data_store import get_default_store
+from performance_metrics import compute_performance_metrics
+from backtest_charts import result_paths, save_backtest_series, get_or_render_chart
+from risk_management import RiskManager
 import os
+import time
+import shutil
+import logging
+import tempfile
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# Modelos de backtesting aislados de los de producción
+BACKTEST_MODEL_DIR = os.getenv("BACKTEST_MODEL_DIR", "backtest_models")
+
+# Caché en memoria de modelos por ventana, compartida por todos los Backtester del proceso
+MAX_WINDOW_MODELS = 64
+_window_models = OrderedDict()
+_window_models_lock = threading.Lock()
+
+# Parámetros que admite un barrido de Backtester.run_grid
+GRID_WINDOW_PARAMS = ('train_period_days', 'retrain_interval')
+GRID_RISK_PARAMS = ('max_portfolio_risk', 'max_position_size', 'stop_loss_pct')
+GRID_PARAMS = GRID_WINDOW_PARAMS + ('threshold',) + GRID_RISK_PARAMS
+RANK_METRICS = ('total_return', 'annualized_return', 'sharpe_ratio', 'sortino_ratio',
+                'max_drawdown', 'win_rate', 'final_balance')
+
+# Límites de riesgo por defecto (los mismos que el RiskManager de la API)
+DEFAULT_RISK_LIMITS = {'max_portfolio_risk': 0.02, 'max_position_size': 0.1, 'stop_loss_pct': 0.05}
 
 class Backtester:
-    def __init__(self, initial_balance=10000):
+    def __init__(self, initial_balance=10000, data_store=None, threshold=2.0, risk_manager=None):
+        """
+        Parámetros:
+        - initial_balance: Capital inicial
+        - data_store: Almacén de datos OHLCV (por defecto, el almacén local compartido)
+        - threshold: Cambio previsto (%) a partir del cual se compra o se vende
+        - risk_manager: RiskManager opcional; si se indica, dimensiona las compras y aplica
+          su stop loss. Sin él se invierte el 10% del balance en cada compra
+        """
         self.initial_balance = initial_balance
+        self.data_store = data_store or get_default_store()
+        self.threshold = threshold
+        self.risk_manager = risk_manager
         self.balance = initial_balance
         self.positions = {}  # {symbol: {'quantity': qty, 'purchase_price': price}}
         self.trade_history = []
         self.portfolio_value = []
         self.dates = []
+        self.model_cache_hits = 0
+        self.model_cache_misses = 0
+        self.series_path = None
+        self.chart_path = None
         
+    def fetch_history(self, symbol, asset_type, start_date, end_date):
+        """Obtener todo el historial del rango en una sola lectura (almacén local + descarga incremental)"""
+        return self.data_store.get(symbol, asset_type, start=start_date, end=end_date)
+    
     def fetch_stock_data(self, symbol, start_date, end_date):
         """Obtener datos históricos de acciones"""
-        data = yf.download(symbol, start=start_date, end=end_date)
-        return data
+        return self.fetch_history(symbol, 'stock', start_date, end_date)
     
     def fetch_crypto_data(self, symbol, start_date, end_date):
         """Obtener datos históricos de criptomonedas"""
-        exchange = ccxt.binance()
-        since = exchange.parse8601(start_date)
-        ohlcv = exchange.fetch_ohlcv(symbol, '1d', since=since)
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df = df[df['timestamp'] <= pd.to_datetime(end_date)]
-        return df
+        return self.fetch_history(symbol, 'crypto', start_date, end_date).reset_index()
     
     def run_backtest(self, symbol, asset_type, model_type, start_date, end_date, 
-                    train_period_days=365, retrain_interval=30):
+                    train_period_days=365, retrain_interval=30, render_chart=False, checkpoint=None):
         """
         Ejecutar backtesting de una estrategia de trading basada en predicciones
         
+        El rango completo (incluido el periodo de entrenamiento) se obtiene una sola vez.
+        Para cada ventana de reentrenamiento se predicen todas sus barras en una única
+        llamada de inferencia, usando en cada barra solo el historial hasta esa barra.
+        
         Parámetros:
         - symbol: Símbolo del activo
         - asset_type: 'stock' o 'crypto'
@@ -45,101 +89,72 @@ class Backtester:
         - end_date: Fecha de fin del backtesting (formato: 'YYYY-MM-DD')
         - train_period_days: Días de datos para entrenar el modelo
         - retrain_interval: Intervalo en días para reentrenar el modelo
+        - render_chart: Dibujar el gráfico ahora (por defecto solo se guarda la serie)
+        - checkpoint: Función opcional llamada al inicio de cada ventana (puede lanzar una
+          excepción para cancelar el backtesting)
         """
-        # Obtener datos históricos
-        if asset_type == 'stock':
-            data = self.fetch_stock_data(symbol, start_date, end_date)
-        else:  # crypto
-            data = self.fetch_crypto_data(symbol, start_date, end_date)
-        
         # Convertir fechas a datetime
         start_date = pd.to_datetime(start_date)
         end_date = pd.to_datetime(end_date)
         
-        # Inicializar variables
-        current_date = start_date
-        last_retrain_date = start_date - timedelta(days=retrain_interval)
+        # Obtener datos históricos (una sola vez, incluyendo el historial de entrenamiento)
+        history = self.fetch_history(symbol, asset_type, start_date - timedelta(days=train_period_days), end_date)
+        self.run_on_history(symbol, asset_type, model_type, history.index.values, history['close'].values,
+                            start_date, end_date, train_period_days, retrain_interval, checkpoint)
+        
+        # Guardar la serie para dibujar el gráfico bajo demanda
+        self.save_series(symbol, asset_type, model_type)
+        if render_chart:
+            self.plot_results(symbol, asset_type, model_type)
+        
+        return {
+            'initial_balance': self.initial_balance,
+            'final_balance': self.balance,
+            'total_return': (self.balance - self.initial_balance) / self.initial_balance * 100,
+            'trade_history': self.trade_history,
+            'portfolio_values': self.portfolio_value,
+            'dates': self.dates,
+            'series_path': self.series_path,
+            'chart_path': self.chart_path
+        }
+    
+    def run_on_history(self, symbol, asset_type, model_type, dates, closes, start_date, end_date,
+                       train_period_days=365, retrain_interval=30, checkpoint=None):
+        """
+        Simular la estrategia sobre un historial ya cargado y calcular sus métricas
+        
+        dates (datetime64[ns]) y closes pueden ser arrays en memoria o memmaps de solo
+        lectura: solo se copian los tramos de entrenamiento de cada ventana.
+        """
+        start_date = pd.to_datetime(start_date)
+        end_date = pd.to_datetime(end_date)
+        first_bar = int(np.searchsorted(dates, np.datetime64(start_date)))
         
-        # Iterar sobre cada día en el período de backtesting
-        for i in range(len(data)):
-            current_date = data.index[i]
-            current_price = data['close'].iloc[i]
+        # Recorrer el periodo por ventanas de reentrenamiento
+        window_start = first_bar
+        while window_start < len(closes):
+            if checkpoint is not None:
+                checkpoint()
+            window_limit = dates[window_start] + np.timedelta64(retrain_interval, 'D')
+            window_end = int(np.searchsorted(dates, window_limit))
             
-            # Registrar el valor del portafolio
-            portfolio_value = self.balance
-            for asset, position in self.positions.items():
-                portfolio_value += position['quantity'] * current_price
+            # Reentrenar el modelo al inicio de cada ventana con el historial ya cargado
+            predictor = self.get_window_model(symbol, asset_type, model_type, dates, closes, window_start, train_period_days)
             
-            self.portfolio_value.append(portfolio_value)
-            self.dates.append(current_date)
+            # Predicciones de todas las barras de la ventana en una sola llamada
+            bar_indices = np.arange(window_start, window_end)
+            predicted_prices = predictor.predict_history(closes, bar_indices)
             
-            # Reentrenar el modelo si es necesario
-            if (current_date - last_retrain_date).days >= retrain_interval:
-                train_start = current_date - timedelta(days=train_period_days)
-                train_end = current_date - timedelta(days=1)
-                
-                # Obtener datos de entrenamiento
-                if asset_type == 'stock':
-                    train_data = self.fetch_stock_data(symbol, train_start.strftime('%Y-%m-%d'), train_end.strftime('%Y-%m-%d'))
-                else:  # crypto
-                    train_data = self.fetch_crypto_data(symbol, train_start.strftime('%Y-%m-%d'), train_end.strftime('%Y-%m-%d'))
-                
-                # Entrenar el modelo
-                predictor = TradingPredictor(model_type=model_type)
-                predictor.train(symbol, asset_type, look_back=60)
-                
-                last_retrain_date = current_date
+            for i, predicted_price in zip(bar_indices, predicted_prices):
+                self.process_bar(symbol, pd.Timestamp(dates[i]), float(closes[i]), predicted_price)
             
-            # Obtener predicción para el día actual
-            predictor = TradingPredictor(model_type=model_type)
-            if predictor.load_model(symbol, asset_type):
-                prediction = predictor.predict(symbol, asset_type)
-                recommendation = prediction['recommendation']
-                
-                # Ejecutar operación según la recomendación
-                if recommendation == 'comprar' and symbol not in self.positions:
-                    # Comprar con el 10% del balance
-                    invest_amount = self.balance * 0.1
-                    quantity = invest_amount / current_price
-                    
-                    self.positions[symbol] = {
-                        'quantity': quantity,
-                        'purchase_price': current_price
-                    }
-                    
-                    self.balance -= invest_amount
-                    
-                    self.trade_history.append({
-                        'date': current_date,
-                        'type': 'buy',
-                        'symbol': symbol,
-                        'quantity': quantity,
-                        'price': current_price,
-                        'amount': invest_amount
-                    })
-                
-                elif recommendation == 'vender' and symbol in self.positions:
-                    # Vender toda la posición
-                    position = self.positions[symbol]
-                    quantity = position['quantity']
-                    sale_amount = quantity * current_price
-                    
-                    del self.positions[symbol]
-                    self.balance += sale_amount
-                    
-                    self.trade_history.append({
-                        'date': current_date,
-                        'type': 'sell',
-                        'symbol': symbol,
-                        'quantity': quantity,
-                        'price': current_price,
-                        'amount': sale_amount
-                    })
+            window_start = window_end
         
         # Cerrar todas las posiciones al final del backtesting
+        last_price = float(closes[-1]) if len(closes) else 0.0
         for symbol, position in self.positions.items():
             quantity = position['quantity']
-            sale_amount = quantity * data['close'].iloc[-1]
+            sale_amount = quantity * last_price
             
             self.balance += sale_amount
             
@@ -148,98 +163,303 @@ class Backtester:
                 'type': 'sell',
                 'symbol': symbol,
                 'quantity': quantity,
-                'price': data['close'].iloc[-1],
+                'price': last_price,
                 'amount': sale_amount
             })
+            if self.risk_manager is not None:
+                self.risk_manager.remove_position(symbol)
+        self.positions = {}
         
         # Calcular métricas de rendimiento
-        self.calculate_performance_metrics()
+        return self.calculate_performance_metrics()
+    
+    def get_window_model(self, symbol, asset_type, model_type, dates, closes, window_start, train_period_days, look_back=60):
+        """
+        Obtener el modelo de una ventana de reentrenamiento, entrenándolo solo si no está en caché
+        
+        El modelo se entrena con los train_period_days anteriores a la barra window_start
+        del historial cargado (dates, closes). Se guarda en un espacio aparte (BACKTEST_MODEL_DIR) para
+        no sobrescribir los modelos de producción, y se reutiliza en memoria y en disco para
+        la misma clave (símbolo, modelo, fin de la ventana de entrenamiento).
+        """
+        bar_date = pd.Timestamp(dates[window_start])
+        train_start = int(np.searchsorted(dates, np.datetime64(bar_date - timedelta(days=train_period_days))))
+        if window_start - train_start <= look_back:
+            raise ValueError(f"Historial insuficiente para entrenar {model_type} antes de {bar_date.date()}")
         
-        # Generar gráficos
-        self.plot_results(symbol, asset_type, model_type)
+        window_end = pd.Timestamp(dates[window_start - 1])
+        key = (symbol, asset_type, model_type, window_end, train_period_days, look_back)
+        with _window_models_lock:
+            predictor = _window_models.get(key)
+            if predictor is not None:
+                _window_models.move_to_end(key)
+                self.model_cache_hits += 1
+                return predictor
         
-        return {
-            'initial_balance': self.initial_balance,
-            'final_balance': self.balance,
-            'total_return': (self.balance - self.initial_balance) / self.initial_balance * 100,
-            'trade_history': self.trade_history,
-            'portfolio_values': self.portfolio_value,
-            'dates': self.dates
-        }
+        # Nombre del modelo dentro del espacio de backtesting
+        model_name = f"{symbol.replace('/', '-')}@{window_end.strftime('%Y%m%d%H%M')}_{train_period_days}d_{look_back}"
+        predictor = TradingPredictor(model_type=model_type, data_store=self.data_store, model_dir=BACKTEST_MODEL_DIR)
+        if predictor.load_model(model_name, asset_type):
+            self.model_cache_hits += 1
+        else:
+            self.model_cache_misses += 1
+            train_data = pd.DataFrame({'close': np.array(closes[train_start:window_start])},
+                                      index=pd.DatetimeIndex(dates[train_start:window_start], name='timestamp'))
+            predictor.fit(train_data, look_back=look_back)
+            predictor.save_model(model_name, asset_type)
+        
+        with _window_models_lock:
+            _window_models[key] = predictor
+            while len(_window_models) > MAX_WINDOW_MODELS:
+                _window_models.popitem(last=False)
+        return predictor
+    
+    def process_bar(self, symbol, current_date, current_price, predicted_price):
+        """Registrar el valor del portafolio y operar en una barra según la predicción"""
+        # Registrar el valor del portafolio
+        portfolio_value = self.balance
+        for asset, position in self.positions.items():
+            portfolio_value += position['quantity'] * current_price
+        
+        self.portfolio_value.append(portfolio_value)
+        self.dates.append(current_date)
+        
+        # Stop loss (con trailing) del gestor de riesgos, antes de mirar la predicción
+        if self.risk_manager is not None and symbol in self.positions:
+            self.risk_manager.update_position(symbol, current_price)
+            if self.risk_manager.check_stop_loss(symbol, current_price):
+                self.close_position(symbol, current_date, current_price)
+                return
+        
+        if np.isnan(predicted_price):
+            return
+        
+        change_percent = (predicted_price - current_price) / current_price * 100
+        _, recommendation = classify_change(change_percent, self.threshold)
+        
+        # Ejecutar operación según la recomendación
+        if recommendation == 'comprar' and symbol not in self.positions:
+            if self.risk_manager is not None:
+                # Tamaño limitado por el riesgo máximo por operación y el tamaño máximo de posición
+                quantity = self.risk_manager.calculate_position_size(symbol, current_price, self.balance)
+                invest_amount = quantity * current_price
+                self.risk_manager.add_position(symbol, quantity, current_price)
+            else:
+                # Comprar con el 10% del balance
+                invest_amount = self.balance * 0.1
+                quantity = invest_amount / current_price
+            
+            self.positions[symbol] = {
+                'quantity': quantity,
+                'purchase_price': current_price
+            }
+            
+            self.balance -= invest_amount
+            
+            self.trade_history.append({
+                'date': current_date,
+                'type': 'buy',
+                'symbol': symbol,
+                'quantity': quantity,
+                'price': current_price,
+                'amount': invest_amount
+            })
+        
+        elif recommendation == 'vender' and symbol in self.positions:
+            self.close_position(symbol, current_date, current_price)
+    
+    def close_position(self, symbol, current_date, current_price):
+        """Vender toda la posición de un símbolo"""
+        position = self.positions.pop(symbol)
+        quantity = position['quantity']
+        sale_amount = quantity * current_price
+        
+        self.balance += sale_amount
+        if self.risk_manager is not None:
+            self.risk_manager.remove_position(symbol)
+        
+        self.trade_history.append({
+            'date': current_date,
+            'type': 'sell',
+            'symbol': symbol,
+            'quantity': quantity,
+            'price': current_price,
+            'amount': sale_amount
+        })
+    
+    def run_grid(self, symbol, asset_type, model_type, start_date, end_date, param_grid,
+                 rank_by='sharpe_ratio', max_workers=None, threads_per_worker=None, progress_callback=None):
+        """
+        Barrido de parámetros: ejecutar un backtesting por combinación en un pool de procesos
+        
+        El historial se obtiene una sola vez y se comparte con los procesos como memmap de
+        solo lectura, de modo que todos leen las mismas páginas en lugar de recibir una copia.
+        Las combinaciones que comparten (train_period_days, retrain_interval) usan los mismos
+        modelos por ventana: se lanza primero una de ellas y el resto cuando sus modelos ya
+        están en la caché de disco de BACKTEST_MODEL_DIR.
+        
+        Parámetros:
+        - param_grid: Diccionario {parámetro: lista de valores} con claves de GRID_PARAMS
+        - rank_by: Métrica por la que ordenar los resultados (de mayor a menor)
+        - max_workers: Número de procesos (por defecto, min(combinaciones, CPUs))
+        - threads_per_worker: Hilos por proceso (por defecto, CPUs / procesos)
+        - progress_callback: Función opcional llamada con cada combinación terminada
+          ({'completed', 'total', 'result'})
+        
+        Retorna:
+        - Lista de resultados (parámetros + métricas) ordenada, con su posición en 'rank'
+        """
+        unknown = set(param_grid) - set(GRID_PARAMS)
+        if unknown:
+            raise ValueError(f"Parámetros no soportados en el barrido: {', '.join(sorted(unknown))}")
+        if rank_by not in RANK_METRICS:
+            raise ValueError(f"Métrica de ordenación no soportada: {rank_by}")
+        combinations = expand_grid(param_grid)
+        if not combinations:
+            return []
+        
+        # Un único acceso a datos, con el mayor periodo de entrenamiento del barrido
+        start = pd.to_datetime(start_date)
+        longest_train = max(int(params.get('train_period_days', 365)) for params in combinations)
+        history = self.fetch_history(symbol, asset_type, start - timedelta(days=longest_train), end_date)
+        
+        cpu_count = os.cpu_count() or 1
+        max_workers = max_workers or min(len(combinations), cpu_count)
+        threads_per_worker = threads_per_worker or max(1, cpu_count // max_workers)
+        logging.info(f"Barrido de {len(combinations)} combinaciones con {max_workers} procesos x {threads_per_worker} hilos")
+        
+        # Agrupar por ventanas de reentrenamiento: la primera de cada grupo entrena los modelos
+        groups = OrderedDict()
+        for params in combinations:
+            groups.setdefault(tuple(params.get(name) for name in GRID_WINDOW_PARAMS), []).append(params)
+        
+        shared_dir = tempfile.mkdtemp(prefix="backtest_grid_")
+        results = []
+        try:
+            shared = share_history(history, shared_dir)
+            context = multiprocessing.get_context('spawn')
+            from training_pool import _init_worker
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                                     initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+                def submit(params):
+                    return pool.submit(_grid_job, shared, symbol, asset_type, model_type,
+                                       start_date, end_date, self.initial_balance, params)
+                
+                def record(result):
+                    results.append(result)
+                    if progress_callback is not None:
+                        progress_callback({'completed': len(results), 'total': len(combinations), 'result': result})
+                
+                running = {submit(members[0]): (key, members[0]) for key, members in groups.items()}
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        key, params = running.pop(future)
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            # Por ejemplo, un proceso que muere: el resto del barrido continúa
+                            result = dict(params, status='error', error=str(e))
+                        record(result)
+                        
+                        # Con los modelos del grupo ya en disco, lanzar el resto de sus combinaciones
+                        if params is groups[key][0]:
+                            for member in groups[key][1:]:
+                                try:
+                                    running[submit(member)] = (key, member)
+                                except Exception as e:
+                                    # Pool roto (BrokenProcessPool): la combinación queda como error
+                                    record(dict(member, status='error', error=str(e)))
+        finally:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+        
+        return rank_results(results, rank_by)
     
     def calculate_performance_metrics(self):
         """Calcular métricas de rendimiento del backtesting"""
-        # Convertir a DataFrame para facilitar los cálculos
-        df = pd.DataFrame({
-            'date': self.dates,
-            'portfolio_value': self.portfolio_value
-        })
+        metrics = compute_performance_metrics(
+            self.portfolio_value,
+            trade_types=[trade['type'] for trade in self.trade_history],
+            trade_prices=[trade['price'] for trade in self.trade_history],
+            trade_symbols=[trade['symbol'] for trade in self.trade_history]
+        )
         
-        # Calcular retornos diarios
-        df['daily_return'] = df['portfolio_value'].pct_change()
-        
-        # Métricas de rendimiento
-        self.total_return = (df['portfolio_value'].iloc[-1] - df['portfolio_value'].iloc[0]) / df['portfolio_value'].iloc[0] * 100
-        self.annualized_return = (1 + df['daily_return'].mean()) ** 252 - 1
-        self.annualized_volatility = df['daily_return'].std() * np.sqrt(252)
-        self.sharpe_ratio = self.annualized_return / self.annualized_volatility if self.annualized_volatility != 0 else 0
-        
-        # Calcular drawdown máximo
-        df['cumulative_return'] = (1 + df['daily_return']).cumprod()
-        df['cumulative_max'] = df['cumulative_return'].cummax()
-        df['drawdown'] = (df['cumulative_return'] / df['cumulative_max'] - 1) * 100
-        self.max_drawdown = df['drawdown'].min()
-        
-        # Número de operaciones
-        self.num_trades = len(self.trade_history)
-        
-        # Tasa de acierto (win rate)
-        wins = 0
-        for i in range(0, len(self.trade_history), 2):
-            if i + 1 < len(self.trade_history):
-                buy_trade = self.trade_history[i]
-                sell_trade = self.trade_history[i + 1]
-                if buy_trade['type'] == 'buy' and sell_trade['type'] == 'sell':
-                    if sell_trade['price'] > buy_trade['price']:
-                        wins += 1
-        
-        self.win_rate = wins / (len(self.trade_history) // 2) * 100 if self.trade_history else 0
+        self.total_return = metrics['total_return']
+        self.annualized_return = metrics['annualized_return']
+        self.annualized_volatility = metrics['annualized_volatility']
+        self.sharpe_ratio = metrics['sharpe_ratio']
+        self.sortino_ratio = metrics['sortino_ratio']
+        self.max_drawdown = metrics['max_drawdown']
+        self.max_drawdown_duration = metrics['max_drawdown_duration']
+        self.num_trades = metrics['num_trades']
+        self.win_rate = metrics['win_rate']
+        return metrics
+    
+    def save_series(self, symbol, asset_type, model_type):
+        """Guardar la curva de capital en backtest_results/ y fijar las rutas de la serie y del gráfico"""
+        run_id = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self.series_path, self.chart_path = result_paths(symbol, asset_type, model_type, run_id)
+        save_backtest_series(self.series_path, self.dates, self.portfolio_value, self.initial_balance,
+                             f'Backtesting: {symbol} ({asset_type}) con {model_type}')
+        return self.series_path
     
     def plot_results(self, symbol, asset_type, model_type):
         """Generar gráficos de resultados del backtesting"""
-        # Crear figura con subplots
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 10))
-        
-        # Gráfico del valor del portafolio
-        ax1.plot(self.dates, self.portfolio_value, label='Valor del Portafolio')
-        ax1.axhline(y=self.initial_balance, color='r', linestyle='--', label='Balance Inicial')
-        ax1.set_title(f'Backtesting: {symbol} ({asset_type}) con {model_type}')
-        ax1.set_ylabel('Valor ($)')
-        ax1.legend()
-        ax1.grid(True)
-        
-        # Gráfico de drawdown
-        df = pd.DataFrame({
-            'date': self.dates,
-            'portfolio_value': self.portfolio_value
-        })
-        df['daily_return'] = df['portfolio_value'].pct_change()
-        df['cumulative_return'] = (1 + df['daily_return']).cumprod()
-        df['cumulative_max'] = df['cumulative_return'].cummax()
-        df['drawdown'] = (df['cumulative_return'] / df['cumulative_max'] - 1) * 100
-        
-        ax2.fill_between(df['date'], df['drawdown'], 0, color='red', alpha=0.3)
-        ax2.set_title('Drawdown')
-        ax2.set_ylabel('Drawdown (%)')
-        ax2.set_xlabel('Fecha')
-        ax2.grid(True)
-        
-        plt.tight_layout()
-        
-        # Guardar gráfico
-        os.makedirs('backtest_results', exist_ok=True)
-        filename = f"backtest_results/{symbol}_{asset_type}_{model_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        plt.savefig(filename)
-        plt.close()
-        
-        return filename
\ No newline at end of file
+        if self.series_path is None:
+            self.save_series(symbol, asset_type, model_type)
+        return get_or_render_chart(self.series_path, self.chart_path)
+
+
+def expand_grid(param_grid):
+    """Producto cartesiano de un diccionario {parámetro: valores} como lista de diccionarios"""
+    names = list(param_grid)
+    values = [v if isinstance(v, (list, tuple)) else [v] for v in param_grid.values()]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def rank_results(results, rank_by='sharpe_ratio'):
+    """Ordenar los resultados del barrido de mayor a menor métrica (los errores, al final)"""
+    ok = sorted((r for r in results if r.get('status') == 'ok'), key=lambda r: r[rank_by], reverse=True)
+    failed = [r for r in results if r.get('status') != 'ok']
+    for position, result in enumerate(ok + failed, start=1):
+        result['rank'] = position
+    return ok + failed
+
+
+def share_history(history, directory):
+    """Volcar fechas y cierres a ficheros .npy para abrirlos como memmap desde otros procesos"""
+    ts_path = os.path.join(directory, "timestamps.npy")
+    close_path = os.path.join(directory, "close.npy")
+    np.save(ts_path, history.index.values.astype('datetime64[ns]'))
+    np.save(close_path, history['close'].values.astype(np.float64))
+    return ts_path, close_path
+
+
+def _grid_job(shared, symbol, asset_type, model_type, start_date, end_date, initial_balance, params):
+    """Ejecutar una combinación del barrido sobre el historial compartido (memmap)"""
+    ts_path, close_path = shared
+    dates = np.load(ts_path, mmap_mode='r')
+    closes = np.load(close_path, mmap_mode='r')
+    
+    risk_manager = None
+    if any(name in params for name in GRID_RISK_PARAMS):
+        limits = dict(DEFAULT_RISK_LIMITS)
+        limits.update({name: params[name] for name in GRID_RISK_PARAMS if name in params})
+        risk_manager = RiskManager(**limits)
+    
+    started = time.perf_counter()
+    result = dict(params, status='ok', error=None, worker_pid=os.getpid())
+    try:
+        backtester = Backtester(initial_balance=initial_balance, threshold=params.get('threshold', 2.0),
+                                risk_manager=risk_manager)
+        metrics = backtester.run_on_history(symbol, asset_type, model_type, dates, closes, start_date, end_date,
+                                            train_period_days=int(params.get('train_period_days', 365)),
+                                            retrain_interval=int(params.get('retrain_interval', 30)))
+        result.update(metrics)
+        result['final_balance'] = backtester.balance
+    except Exception as e:
+        logging.error(f"Error en la combinación {params} del barrido: {e}")
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - started
+    return result
@@ -0,0 +1,162 @@
+# benchmark_account_performance.py - Valoración de posiciones: N+1 consultas frente a una sola consulta
+import os
+import time
+import tempfile
+import warnings
+from datetime import datetime, timedelta
+from unittest import mock
+import numpy as np
+from sqlalchemy.exc import SAWarning
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Numeric, ForeignKey, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+import portfolio_valuation
+from portfolio_valuation import positions_value
+
+POSITION_COUNTS = [10, 50, 200, 1000]
+OPERATIONS_PER_POSITION = 5
+BARS_PER_ASSET = 30
+REPEATS = 5
+
+# SQLite guarda Numeric como coma flotante; el aviso no afecta a la comparación
+warnings.filterwarnings('ignore', category=SAWarning)
+
+# Copia mínima de las tablas de main.py para no depender de la configuración de la API
+Base = declarative_base()
+
+
+class Asset(Base):
+    __tablename__ = "activos"
+    id = Column(Integer, primary_key=True)
+    simbolo = Column(String(20), unique=True)
+
+
+class MarketData(Base):
+    __tablename__ = "datos_mercado"
+    id = Column(Integer, primary_key=True)
+    activo_id = Column(Integer, ForeignKey("activos.id"))
+    fecha = Column(DateTime, nullable=False)
+    cierre = Column(Numeric(20, 8))
+    __table_args__ = (UniqueConstraint('activo_id', 'fecha', name='_activo_fecha_uc'),)
+
+
+class SimulationAccount(Base):
+    __tablename__ = "simulation_accounts"
+    id = Column(Integer, primary_key=True)
+    current_balance = Column(Numeric(15, 2))
+
+
+class SimulationOperation(Base):
+    __tablename__ = "simulation_operations"
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("simulation_accounts.id"))
+    asset_id = Column(Integer, ForeignKey("activos.id"))
+    operation_type = Column(String(10))
+    quantity = Column(Numeric(20, 8))
+    price = Column(Numeric(20, 8))
+    timestamp = Column(DateTime)
+
+
+class SimulationPosition(Base):
+    __tablename__ = "simulation_positions"
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("simulation_accounts.id"))
+    asset_id = Column(Integer, ForeignKey("activos.id"))
+    quantity = Column(Numeric(20, 8))
+    average_price = Column(Numeric(20, 8))
+    __table_args__ = (UniqueConstraint('account_id', 'asset_id', name='_account_asset_uc'),)
+
+
+def populate(engine, position_counts):
+    """Crear una cuenta sintética por tamaño, con sus operaciones y precios de mercado"""
+    rng = np.random.default_rng(0)
+    now = datetime(2024, 1, 1)
+    n_assets = max(position_counts)
+    with engine.begin() as conn:
+        conn.execute(Asset.__table__.insert(), [{'id': i, 'simbolo': f"SYM{i}"} for i in range(1, n_assets + 1)])
+        conn.execute(MarketData.__table__.insert(), [
+            {'activo_id': i, 'fecha': now - timedelta(days=d), 'cierre': float(rng.uniform(10, 500))}
+            for i in range(1, n_assets + 1) for d in range(BARS_PER_ASSET)
+        ])
+        for account_id, n_positions in enumerate(position_counts, start=1):
+            conn.execute(SimulationAccount.__table__.insert(), [{'id': account_id, 'current_balance': 10000}])
+            conn.execute(SimulationPosition.__table__.insert(), [
+                {'account_id': account_id, 'asset_id': i, 'quantity': 10, 'average_price': 100}
+                for i in range(1, n_positions + 1)
+            ])
+            conn.execute(SimulationOperation.__table__.insert(), [
+                {'account_id': account_id, 'asset_id': i, 'operation_type': 'buy', 'quantity': 2,
+                 'price': float(rng.uniform(10, 500)), 'timestamp': now - timedelta(hours=k)}
+                for i in range(1, n_positions + 1) for k in range(OPERATIONS_PER_POSITION)
+            ])
+
+
+def value_n_plus_one(db, account_id):
+    """Implementación anterior: una consulta de 'última operación' por posición"""
+    positions = db.query(SimulationPosition).filter(SimulationPosition.account_id == account_id).all()
+    total = 0
+    for position in positions:
+        last_operation = db.query(SimulationOperation).filter(
+            SimulationOperation.account_id == account_id,
+            SimulationOperation.asset_id == position.asset_id
+        ).order_by(SimulationOperation.timestamp.desc()).first()
+        if last_operation:
+            total += position.quantity * last_operation.price
+    return total
+
+
+def measure(session_factory, counter, function, account_id):
+    """Mediana de la latencia y número de consultas de una valoración"""
+    samples = []
+    for _ in range(REPEATS):
+        db = session_factory()
+        counter['queries'] = 0
+        start = time.perf_counter()
+        total = function(db, account_id)
+        samples.append(time.perf_counter() - start)
+        db.close()
+    return total, counter['queries'], np.median(samples) * 1000
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    populate(engine, POSITION_COUNTS)
+    session_factory = sessionmaker(bind=engine)
+
+    counter = {'queries': 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_queries(*args):
+        counter['queries'] += 1
+
+    def single_query(db, account_id):
+        return positions_value(db, account_id, SimulationPosition, SimulationOperation)[0]
+
+    def single_query_fallback(db, account_id):
+        # Forzar la subconsulta correlacionada de SQLite < 3.25
+        with mock.patch.object(portfolio_valuation, '_supports_window_functions', return_value=False):
+            return positions_value(db, account_id, SimulationPosition, SimulationOperation)[0]
+
+    def single_query_market(db, account_id):
+        return positions_value(db, account_id, SimulationPosition, SimulationOperation, MarketData)[0]
+
+    variants = [
+        ('N+1 (última operación)', value_n_plus_one),
+        ('1 consulta, ROW_NUMBER()', single_query),
+        ('1 consulta, correlacionada', single_query_fallback),
+        ('1 consulta, datos_mercado', single_query_market),
+    ]
+
+    print(f"📊 Valoración de posiciones en SQLite (mediana de {REPEATS} repeticiones, "
+          f"{OPERATIONS_PER_POSITION} operaciones por posición)")
+    print(f"{'posiciones':>10} {'variante':<28} {'consultas':>10} {'ms':>10} {'valor':>16}")
+    for account_id, n_positions in enumerate(POSITION_COUNTS, start=1):
+        for name, function in variants:
+            total, queries, latency = measure(session_factory, counter, function, account_id)
+            print(f"{n_positions:>10} {name:<28} {queries:>10} {latency:>10.2f} {float(total):>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
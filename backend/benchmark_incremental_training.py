@@ -0,0 +1,65 @@
+# benchmark_incremental_training.py - Reentrenamiento completo del LSTM frente a ajuste incremental
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from market_data_store import FakeOHLCVSource
+from prediction_model import TradingPredictor, last_bar_timestamp
+
+SYMBOL = 'AAPL'
+HISTORY_DAYS = 365
+NEW_DAYS = [7, 30]
+HOLDOUT_DAYS = 30
+EPOCHS = 25
+
+
+def evaluate(predictor, closes, indices):
+    """RMSE (en precio) de la predicción del cierre siguiente en las barras indicadas"""
+    predicted = predictor.predict_history(closes, indices - 1)
+    return float(np.sqrt(np.nanmean((predicted - closes[indices]) ** 2)))
+
+
+def main():
+    source = FakeOHLCVSource()
+    end = datetime(2024, 1, 1)
+    longest = max(NEW_DAYS)
+    frame = source.fetch(SYMBOL, '1d', end - timedelta(days=HISTORY_DAYS), end + timedelta(days=longest + HOLDOUT_DAYS))
+
+    # Modelo de partida entrenado hasta `end`, guardado para reutilizarlo en cada caso
+    base = TradingPredictor(model_type='lstm')
+    base_data = frame[frame.index <= end]
+    base.fit(base_data, epochs=EPOCHS)
+    base.last_bar = last_bar_timestamp(base_data)
+    weights = base.model.get_weights()
+
+    print(f"📊 Reentrenamiento del LSTM ({HISTORY_DAYS} días de historial, {EPOCHS} épocas en el completo, "
+          f"RMSE sobre los {HOLDOUT_DAYS} días siguientes a la actualización)")
+    print(f"{'días nuevos':>11} {'modo':<12} {'épocas':>7} {'segundos':>9} {'pérdida val':>12} {'RMSE fuera':>11}")
+    for new_days in NEW_DAYS:
+        update = end + timedelta(days=new_days)
+        data = frame[frame.index <= update]
+        holdout = np.flatnonzero((frame.index > update) & (frame.index <= update + timedelta(days=HOLDOUT_DAYS)))
+        closes = frame['close'].values
+
+        full = TradingPredictor(model_type='lstm')
+        start = time.perf_counter()
+        full_loss = full.fit(data, epochs=EPOCHS)
+        full_seconds = time.perf_counter() - start
+
+        incremental = TradingPredictor(model_type='lstm')
+        incremental.model = base.model
+        incremental.model.set_weights(weights)
+        incremental.scaler = base.scaler
+        incremental.last_bar = base.last_bar
+        start = time.perf_counter()
+        incremental_loss = incremental.fit_incremental(data)
+        incremental_seconds = time.perf_counter() - start
+
+        # Pérdida en escala normalizada: cada modo usa su propio scaler, el RMSE es comparable
+        print(f"{new_days:>11} {'completo':<12} {EPOCHS:>7} {full_seconds:>9.2f} {full_loss:>12.6f} "
+              f"{evaluate(full, closes, holdout):>11.4f}")
+        print(f"{new_days:>11} {'incremental':<12} {incremental.training_report['epochs_run']:>7} "
+              f"{incremental_seconds:>9.2f} {incremental_loss:>12.6f} {evaluate(incremental, closes, holdout):>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmark_lstm_input_pipeline.py - Memoria máxima y tiempo de una época del LSTM según la entrada de datos
+import sys
+import time
+import resource
+import subprocess
+import numpy as np
+
+SERIES_LENGTHS = [50_000, 200_000]  # Barras horarias: ~5,7 y ~23 años
+LOOK_BACK = 60
+BATCH_SIZE = 512
+
+
+def synthetic_series(n):
+    rng = np.random.default_rng(42)
+    series = np.cumsum(rng.normal(0, 1, n))
+    return (series - series.min()) / (series.max() - series.min())
+
+
+def run(mode, n):
+    """Entrenar una época en este proceso e imprimir 'segundos memoria_máxima_MB'"""
+    from prediction_model import TradingPredictor
+    from windowing import sliding_windows, window_dataset
+
+    series = synthetic_series(n)
+    model = TradingPredictor(model_type='lstm').build_lstm_model((LOOK_BACK, 1))
+    start = time.perf_counter()
+    if mode == 'arrays':
+        # Camino anterior: el tensor completo de ventanas se copia al entrenar
+        X, y = sliding_windows(series, LOOK_BACK)
+        model.fit(np.asarray(X)[..., np.newaxis], np.asarray(y), epochs=1, batch_size=BATCH_SIZE, verbose=0)
+    elif mode == 'keras':
+        # Utilidad de Keras: también O(n) en memoria, pero genera las ventanas una a una
+        import tensorflow as tf
+        series = series.astype(np.float32)
+        dataset = tf.keras.utils.timeseries_dataset_from_array(
+            series[:-1, np.newaxis], series[LOOK_BACK:], LOOK_BACK, batch_size=BATCH_SIZE, shuffle=True, seed=42
+        ).prefetch(tf.data.AUTOTUNE)
+        model.fit(dataset, epochs=1, verbose=0)
+    else:
+        dataset, _ = window_dataset(series, LOOK_BACK, BATCH_SIZE, shuffle=True, cache=False)
+        model.fit(dataset, epochs=1, verbose=0)
+    seconds = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{seconds} {peak_mb}")
+
+
+def main():
+    print(f"📊 Una época del LSTM (look_back={LOOK_BACK}, lotes de {BATCH_SIZE}), cada caso en un proceso nuevo")
+    print(f"{'barras':>8} {'entrada':<8} {'ventanas (MB)':>14} {'segundos':>9} {'memoria máx. (MB)':>18}")
+    print("   arrays = ventanas en NumPy, keras = timeseries_dataset_from_array, tf.data = window_dataset")
+    for n in SERIES_LENGTHS:
+        windows_mb = (n - LOOK_BACK) * LOOK_BACK * 4 / 1e6
+        for mode in ['arrays', 'keras', 'tf.data']:
+            output = subprocess.run([sys.executable, __file__, mode, str(n)], capture_output=True, text=True, check=True)
+            seconds, peak_mb = map(float, output.stdout.split()[-2:])
+            print(f"{n:>8} {mode:<8} {windows_mb:>14.1f} {seconds:>9.2f} {peak_mb:>18.0f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run(sys.argv[1], int(sys.argv[2]))
+    else:
+        main()
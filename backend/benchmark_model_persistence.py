@@ -0,0 +1,79 @@
+# benchmark_model_persistence.py - Comparar la carga del LSTM con joblib (.pkl) frente a .keras nativo
+import os
+import time
+import tempfile
+import joblib
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from prediction_model import TradingPredictor
+from windowing import sliding_windows
+
+LOOK_BACK = 60
+REPEATS = 5
+
+
+def train_small_model():
+    """Entrenar un LSTM pequeño sobre una serie sintética"""
+    rng = np.random.default_rng(42)
+    series = np.cumsum(rng.normal(0, 1, 1000))
+    series = (series - series.min()) / (series.max() - series.min())
+    X, y = sliding_windows(series, LOOK_BACK)
+    predictor = TradingPredictor(model_type='lstm')
+    model = predictor.build_lstm_model((LOOK_BACK, 1))
+    model.fit(X[..., np.newaxis], y, epochs=1, batch_size=64, verbose=0)
+    return model, X[-1:][..., np.newaxis].astype(np.float32)
+
+
+def measure(load, predict, window):
+    """Medir el tiempo de carga y la latencia de la primera predicción y de las siguientes"""
+    start = time.perf_counter()
+    model = load()
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    predict(model, window)
+    first_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(20):
+        predict(model, window)
+    steady_time = (time.perf_counter() - start) / 20
+    return load_time, first_time, steady_time
+
+
+def main():
+    model, window = train_small_model()
+    tmp_dir = tempfile.mkdtemp()
+    pkl_path = os.path.join(tmp_dir, "model.pkl")
+    keras_path = os.path.join(tmp_dir, "model.keras")
+    joblib.dump(model, pkl_path)
+    model.save(keras_path)
+
+    def predict_pickle(m, x):
+        return m.predict(x, verbose=0)
+
+    def load_keras():
+        m = load_model(keras_path, compile=False)
+        infer = tf.function(lambda x: m(x, training=False),
+                            input_signature=[tf.TensorSpec(shape=(None, LOOK_BACK, 1), dtype=tf.float32)])
+        return infer
+
+    def predict_keras(infer, x):
+        return infer(tf.convert_to_tensor(x)).numpy()
+
+    results = {
+        'joblib .pkl + model.predict': [measure(lambda: joblib.load(pkl_path), predict_pickle, window) for _ in range(REPEATS)],
+        '.keras + tf.function': [measure(load_keras, predict_keras, window) for _ in range(REPEATS)],
+    }
+
+    print(f"📊 Persistencia del LSTM (mediana de {REPEATS} repeticiones)")
+    print(f"   Tamaño .pkl: {os.path.getsize(pkl_path) / 1e6:.2f} MB, .keras: {os.path.getsize(keras_path) / 1e6:.2f} MB")
+    print(f"{'camino':<30} {'carga (ms)':>12} {'1ª pred (ms)':>14} {'pred (ms)':>10}")
+    for name, samples in results.items():
+        load_time, first_time, steady_time = np.median(np.array(samples), axis=0) * 1000
+        print(f"{name:<30} {load_time:>12.1f} {first_time:>14.1f} {steady_time:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# benchmark_training_split.py - División barajada sin parada temprana frente a división temporal con parada temprana
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sklearn.model_selection import train_test_split
+from market_data_store import FakeOHLCVSource
+from prediction_model import TradingPredictor
+
+SYMBOLS = ['AAPL', 'MSFT']
+HISTORY_DAYS = 730
+HOLDOUT_DAYS = 60
+EPOCHS = 25
+LOOK_BACK = 60
+
+
+def fit_shuffled(predictor, data):
+    """Entrenamiento anterior: train_test_split barajado y todas las épocas / árboles"""
+    if predictor.model_type == 'lstm':
+        X, y = predictor.preprocess_data(data, LOOK_BACK)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        predictor.model = predictor.build_lstm_model((LOOK_BACK, 1))
+        predictor.model.fit(X_train[..., np.newaxis], y_train, epochs=EPOCHS, batch_size=32, verbose=0,
+                            validation_data=(X_test[..., np.newaxis], y_test))
+        predictor._build_inference_function()
+        return EPOCHS
+    X, y = predictor.preprocess_data_for_tree_models(data, LOOK_BACK)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    predictor.model = predictor.build_xgboost_model()
+    predictor.model.fit(X_train, y_train)
+    return predictor.model.n_estimators
+
+
+def fit_chronological(predictor, data):
+    """Entrenamiento actual: validación con la cola de la serie y parada temprana"""
+    predictor.fit(data, LOOK_BACK, epochs=EPOCHS)
+    return predictor.training_report['epochs_run']
+
+
+def holdout_rmse(predictor, closes, indices):
+    """RMSE (en precio) de la predicción del cierre siguiente en barras posteriores al entrenamiento"""
+    predicted = predictor.predict_history(closes, indices - 1)
+    return float(np.sqrt(np.nanmean((predicted - closes[indices]) ** 2)))
+
+
+def main():
+    source = FakeOHLCVSource()
+    end = datetime(2024, 1, 1)
+
+    print(f"📊 Entrenamiento con {HISTORY_DAYS} días de historial; RMSE sobre los {HOLDOUT_DAYS} días siguientes")
+    print(f"{'símbolo':<8} {'modelo':<8} {'división':<26} {'épocas/árboles':>15} {'segundos':>9} {'RMSE fuera':>11}")
+    for symbol in SYMBOLS:
+        frame = source.fetch(symbol, '1d', end - timedelta(days=HISTORY_DAYS), end + timedelta(days=HOLDOUT_DAYS))
+        data = frame[frame.index <= end]
+        closes = frame['close'].values
+        holdout = np.flatnonzero(frame.index > end)
+
+        for model_type in ['lstm', 'xgboost']:
+            for name, fit in [('barajada, sin parada', fit_shuffled), ('temporal, parada temprana', fit_chronological)]:
+                predictor = TradingPredictor(model_type=model_type)
+                start = time.perf_counter()
+                rounds = fit(predictor, data)
+                seconds = time.perf_counter() - start
+                print(f"{symbol:<8} {model_type:<8} {name:<26} {rounds:>15} {seconds:>9.2f} "
+                      f"{holdout_rmse(predictor, closes, holdout):>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# benchmark_windowing.py - Comparar la construcción de ventanas con bucle vs vistas de NumPy
+import time
+import numpy as np
+from windowing import sliding_windows, sliding_windows_loop
+
+LOOK_BACK = 60
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def time_call(func, *args, repeats=3):
+    """Devolver el mejor tiempo (en segundos) de varias ejecuciones"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"📊 Construcción de ventanas (look_back={LOOK_BACK})")
+    print(f"{'barras':>10} {'bucle (s)':>12} {'vista (s)':>12} {'aceleración':>12} {'MB bucle':>10}")
+    rng = np.random.default_rng(42)
+    for n in SIZES:
+        series = rng.random((n, 1))
+
+        # Comprobar que ambos caminos producen lo mismo
+        X_loop, y_loop = sliding_windows_loop(series, LOOK_BACK)
+        X_view, y_view = sliding_windows(series, LOOK_BACK)
+        assert np.array_equal(X_loop, X_view) and np.array_equal(y_loop, y_view)
+        loop_mb = X_loop.nbytes / 1e6
+        del X_loop, y_loop
+
+        loop_time = time_call(sliding_windows_loop, series, LOOK_BACK, repeats=1 if n >= 1_000_000 else 3)
+        view_time = time_call(sliding_windows, series, LOOK_BACK)
+        print(f"{n:>10} {loop_time:>12.4f} {view_time:>12.6f} {loop_time / view_time:>11.0f}x {loop_mb:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
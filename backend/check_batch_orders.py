@@ -0,0 +1,145 @@
+# check_batch_orders.py - Comprobar que un lote de órdenes deja la cuenta igual que ejecutarlas una a una
+#
+# Carga simulator.py con una copia mínima de las tablas de main.py sobre SQLite en memoria y
+# compara saldo, cantidades y precios medios de execute_orders frente a execute_buy_order /
+# execute_sell_order en el mismo orden.
+import os
+import sys
+import types
+import warnings
+import importlib
+from decimal import Decimal
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Numeric, ForeignKey, UniqueConstraint
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+# SQLite guarda Numeric como coma flotante; se compara con tolerancia
+warnings.filterwarnings('ignore', category=SAWarning)
+TOLERANCE = Decimal('1e-6')
+
+Base = declarative_base()
+
+
+class Asset(Base):
+    __tablename__ = "activos"
+    id = Column(Integer, primary_key=True)
+    simbolo = Column(String(20), unique=True)
+
+
+class SimulationAccount(Base):
+    __tablename__ = "simulation_accounts"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    account_name = Column(String(100))
+    initial_balance = Column(Numeric(15, 2))
+    current_balance = Column(Numeric(15, 2))
+    created_at = Column(DateTime)
+
+
+class SimulationOperation(Base):
+    __tablename__ = "simulation_operations"
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("simulation_accounts.id"))
+    asset_id = Column(Integer, ForeignKey("activos.id"))
+    operation_type = Column(String(10))
+    quantity = Column(Numeric(20, 8))
+    price = Column(Numeric(20, 8))
+    timestamp = Column(DateTime)
+
+
+class SimulationPosition(Base):
+    __tablename__ = "simulation_positions"
+    id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, ForeignKey("simulation_accounts.id"))
+    asset_id = Column(Integer, ForeignKey("activos.id"))
+    quantity = Column(Numeric(20, 8))
+    average_price = Column(Numeric(20, 8))
+    updated_at = Column(DateTime)
+    __table_args__ = (UniqueConstraint('account_id', 'asset_id', name='_account_asset_uc'),)
+
+
+# (descripción, posiciones iniciales {asset_id: (cantidad, precio medio)}, órdenes)
+CASES = [
+    ("Compra y venta del mismo tamaño sobre una posición existente",
+     {1: (10, 50)},
+     [{'asset_id': 1, 'side': 'buy', 'quantity': 5, 'price': 70},
+      {'asset_id': 1, 'side': 'sell', 'quantity': 5, 'price': 80}]),
+    ("Varias compras y ventas en dos activos",
+     {1: (4, 20)},
+     [{'asset_id': 1, 'side': 'buy', 'quantity': 6, 'price': 25},
+      {'asset_id': 2, 'side': 'buy', 'quantity': 3, 'price': 100},
+      {'asset_id': 1, 'side': 'sell', 'quantity': 2, 'price': 30},
+      {'asset_id': 2, 'side': 'sell', 'quantity': 3, 'price': 110}]),
+]
+
+
+def load_simulator():
+    """Importar simulator.py como parte de un paquete cuyo módulo models son las tablas de arriba"""
+    package = types.ModuleType("simulation_check")
+    package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    models = types.ModuleType("simulation_check.models")
+    for model in (Asset, SimulationAccount, SimulationOperation, SimulationPosition):
+        setattr(models, model.__name__, model)
+    package.models = models
+    sys.modules["simulation_check"] = package
+    sys.modules["simulation_check.models"] = models
+    return importlib.import_module("simulation_check.simulator").TradingSimulator
+
+
+def account_state(db, account_id):
+    account = db.query(SimulationAccount).filter(SimulationAccount.id == account_id).first()
+    positions = db.query(SimulationPosition).filter(SimulationPosition.account_id == account_id).all()
+    return Decimal(account.current_balance), {
+        position.asset_id: (Decimal(position.quantity), Decimal(position.average_price)) for position in positions
+    }
+
+
+def run_case(TradingSimulator, initial_positions, orders, batched):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([Asset(id=1, simbolo="AAA"), Asset(id=2, simbolo="BBB")])
+    db.add(SimulationAccount(id=1, user_id=1, account_name="check", initial_balance=10000, current_balance=10000))
+    db.add_all([SimulationPosition(account_id=1, asset_id=asset_id, quantity=quantity, average_price=price)
+                for asset_id, (quantity, price) in initial_positions.items()])
+    db.commit()
+
+    simulator = TradingSimulator(db)
+    if batched:
+        simulator.execute_orders(1, orders)
+    else:
+        for order in orders:
+            execute = simulator.execute_buy_order if order['side'] == 'buy' else simulator.execute_sell_order
+            execute(1, order['asset_id'], Decimal(order['quantity']), Decimal(order['price']))
+    return account_state(db, 1)
+
+
+def same_state(a, b):
+    (balance_a, positions_a), (balance_b, positions_b) = a, b
+    if abs(balance_a - balance_b) > TOLERANCE or positions_a.keys() != positions_b.keys():
+        return False
+    return all(abs(x - y) <= TOLERANCE
+               for asset_id in positions_a for x, y in zip(positions_a[asset_id], positions_b[asset_id]))
+
+
+def main():
+    TradingSimulator = load_simulator()
+    failures = 0
+    for description, initial_positions, orders in CASES:
+        batched = run_case(TradingSimulator, initial_positions, orders, batched=True)
+        sequential = run_case(TradingSimulator, initial_positions, orders, batched=False)
+        if same_state(batched, sequential):
+            print(f"✅ {description}")
+        else:
+            failures += 1
+            print(f"❌ {description}\n   lote: {batched}\n   una a una: {sequential}")
+
+    if failures:
+        print(f"\n❌ {failures} caso(s) con resultados distintos")
+        sys.exit(1)
+    print("\n✅ El lote deja la cuenta igual que las órdenes una a una")
+
+
+if __name__ == "__main__":
+    main()
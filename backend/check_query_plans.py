@@ -0,0 +1,123 @@
+# check_query_plans.py - Comprobar que las consultas frecuentes usan los índices de las migraciones
+#
+# Crea el esquema anterior a los índices, aplica migrations.run_migrations y revisa el plan
+# de cada consulta con EXPLAIN. Siempre se comprueba SQLite (en un fichero temporal); para
+# PostgreSQL, definir QUERY_PLAN_POSTGRES_URL (se usa un esquema temporal que se borra al final).
+import os
+import sys
+import json
+import tempfile
+from sqlalchemy import create_engine, text
+from migrations import run_migrations
+
+# Tablas tal como existían antes de la migración 0002 (sin índices secundarios)
+LEGACY_SCHEMA = """
+CREATE TABLE simulation_accounts (id {pk}, user_id INTEGER, account_name VARCHAR(100), initial_balance NUMERIC(15, 2),
+                                  current_balance NUMERIC(15, 2), created_at TIMESTAMP);
+CREATE TABLE simulation_operations (id {pk}, account_id INTEGER, asset_id INTEGER, operation_type VARCHAR(10),
+                                    quantity NUMERIC(20, 8), price NUMERIC(20, 8), timestamp TIMESTAMP);
+CREATE TABLE simulation_positions (id {pk}, account_id INTEGER, asset_id INTEGER, quantity NUMERIC(20, 8),
+                                   average_price NUMERIC(20, 8), updated_at TIMESTAMP,
+                                   CONSTRAINT _account_asset_uc UNIQUE (account_id, asset_id));
+CREATE TABLE resultados_backtest (id {pk}, user_id INTEGER, asset_id INTEGER, model_type VARCHAR(50), created_at TIMESTAMP);
+CREATE TABLE predicciones (id {pk}, activo_id INTEGER, fecha_prediccion TIMESTAMP, fecha_objetivo TIMESTAMP,
+                           prediccion VARCHAR(10), recomendacion VARCHAR(10), confianza NUMERIC(5, 4),
+                           modelo VARCHAR(50), fecha_creacion TIMESTAMP)
+"""
+
+# (descripción, consulta, índices aceptados)
+HOT_QUERIES = [
+    ("Historial de operaciones de una cuenta",
+     "SELECT * FROM simulation_operations WHERE account_id = 1 ORDER BY timestamp DESC LIMIT 100",
+     ("ix_simulation_operations_account_timestamp",)),
+    ("Última operación de una cuenta en un activo",
+     "SELECT price FROM simulation_operations WHERE account_id = 1 AND asset_id = 2 ORDER BY timestamp DESC LIMIT 1",
+     ("ix_simulation_operations_account_asset",)),
+    ("Posiciones de una cuenta",
+     "SELECT * FROM simulation_positions WHERE account_id = 1",
+     ("_account_asset_uc", "sqlite_autoindex_simulation_positions_1")),
+    ("Cuentas de un usuario",
+     "SELECT * FROM simulation_accounts WHERE user_id = 1",
+     ("ix_simulation_accounts_user_id",)),
+    ("Resultados de backtesting de un usuario",
+     "SELECT * FROM resultados_backtest WHERE user_id = 1",
+     ("ix_resultados_backtest_user_id",)),
+    ("Predicción de una barra",
+     "SELECT * FROM predicciones WHERE activo_id = 1 AND modelo = 'lstm' AND fecha_barra = '2024-01-02'",
+     ("ix_predicciones_activo_modelo_barra",)),
+]
+
+
+def create_legacy_schema(conn, pk):
+    for statement in LEGACY_SCHEMA.format(pk=pk).split(";"):
+        if statement.strip():
+            conn.execute(text(statement))
+
+
+def sqlite_plan(conn, query):
+    return " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {query}")))
+
+
+def postgres_plan(conn, query):
+    # Sin datos el planificador preferiría un recorrido secuencial: se desactiva para ver si hay índice
+    conn.execute(text("SET enable_seqscan = off"))
+    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+    return json.dumps(plan if not isinstance(plan, str) else json.loads(plan))
+
+
+def check(name, engine, plan_function):
+    print(f"\n🔎 {name}")
+    failures = 0
+    with engine.connect() as conn:
+        for description, query, indexes in HOT_QUERIES:
+            plan = plan_function(conn, query)
+            if any(index in plan for index in indexes):
+                print(f"✅ {description}")
+            else:
+                failures += 1
+                print(f"❌ {description}: no usa {' / '.join(indexes)}")
+                print(f"   Plan: {plan}")
+    return failures
+
+
+def check_sqlite():
+    path = os.path.join(tempfile.mkdtemp(), "query_plans.db")
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        create_legacy_schema(conn, "INTEGER PRIMARY KEY")
+    run_migrations(engine)
+    return check("SQLite", engine, sqlite_plan)
+
+
+def check_postgres(url):
+    schema = "query_plan_check"
+    engine = create_engine(url, connect_args={"options": f"-csearch_path={schema}"})
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+        create_legacy_schema(conn, "SERIAL PRIMARY KEY")
+    try:
+        run_migrations(engine)
+        return check("PostgreSQL", engine, postgres_plan)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+
+
+def main():
+    failures = check_sqlite()
+
+    postgres_url = os.getenv("QUERY_PLAN_POSTGRES_URL")
+    if postgres_url:
+        failures += check_postgres(postgres_url)
+    else:
+        print("\n⏭️  PostgreSQL omitido (definir QUERY_PLAN_POSTGRES_URL para comprobarlo)")
+
+    if failures:
+        print(f"\n❌ {failures} consultas sin el índice esperado")
+        sys.exit(1)
+    print("\n✅ Todas las consultas frecuentes usan sus índices")
+
+
+if __name__ == "__main__":
+    main()
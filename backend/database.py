@@ -0,0 +1,74 @@
+# database.py - Motores de base de datos con pool configurable y motor asíncrono opcional
+import os
+import logging
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+# Controladores asíncronos equivalentes a los síncronos de DATABASE_URL
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def _env_flag(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+def pool_options(database_url):
+    """
+    Opciones del pool de conexiones a partir de variables de entorno
+
+    - DB_POOL_SIZE: Conexiones abiertas que se mantienen (5)
+    - DB_MAX_OVERFLOW: Conexiones adicionales en picos de carga (10)
+    - DB_POOL_TIMEOUT: Segundos de espera por una conexión libre (30)
+    - DB_POOL_RECYCLE: Segundos tras los que se renueva una conexión (1800, -1 para no renovar)
+    - DB_POOL_PRE_PING: Comprobar la conexión antes de usarla (true)
+
+    SQLite no usa un pool de tamaño fijo, así que solo recibe pre_ping y recycle.
+    """
+    options = {
+        'pool_pre_ping': _env_flag("DB_POOL_PRE_PING", True),
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    }
+    if make_url(database_url).get_backend_name() != 'sqlite':
+        options.update({
+            'pool_size': int(os.getenv("DB_POOL_SIZE", 5)),
+            'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", 10)),
+            'pool_timeout': int(os.getenv("DB_POOL_TIMEOUT", 30)),
+        })
+    return options
+
+
+def create_db_engine(database_url):
+    """Motor síncrono con las opciones de pool del entorno"""
+    return create_engine(database_url, **pool_options(database_url))
+
+
+def async_database_url(database_url):
+    """URL equivalente con controlador asíncrono (asyncpg o aiosqlite)"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No hay controlador asíncrono para {backend}")
+    return str(url.set(drivername=ASYNC_DRIVERS[backend]))
+
+
+def create_async_session_factory(database_url):
+    """
+    Fábrica de AsyncSession si DB_ASYNC está activado (ASYNC_DATABASE_URL permite otra URL)
+
+    Retorna None si está desactivado o falta el controlador asíncrono; en ese caso
+    los endpoints asíncronos ejecutan las consultas síncronas en el threadpool.
+    """
+    if not _env_flag("DB_ASYNC", False):
+        return None
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+        from sqlalchemy.orm import sessionmaker
+        url = os.getenv("ASYNC_DATABASE_URL") or async_database_url(database_url)
+        engine = create_async_engine(url, **pool_options(url))
+    except (ImportError, ValueError) as e:
+        logging.warning(f"Motor asíncrono no disponible, se usa el síncrono: {e}")
+        return None
+    return sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,216 @@
+# feature_engine.py
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+
+MA_WINDOWS = (5, 10, 20)
+VOLATILITY_WINDOWS = (5, 10)
+RSI_WINDOW = 14
+
+
+def feature_names(look_back):
+    """Nombres de las columnas de características, en el orden usado por los modelos de árbol"""
+    return ([f'lag_{i}' for i in range(1, look_back + 1)]
+            + [f'ma_{w}' for w in MA_WINDOWS]
+            + [f'volatility_{w}' for w in VOLATILITY_WINDOWS]
+            + ['rsi'])
+
+
+def _feature_frame(closes, look_back):
+    """DataFrame con el cierre y todas las características de cada barra (NaN donde falta historial)"""
+    # Crear características a partir de los precios de cierre pasados
+    df = pd.DataFrame(np.asarray(closes), columns=['close'])
+
+    # Añadir características de retardos (lags)
+    for i in range(1, look_back + 1):
+        df[f'lag_{i}'] = df['close'].shift(i)
+
+    # Añadir características de media móvil
+    df['ma_5'] = df['close'].rolling(window=5).mean().shift(1)
+    df['ma_10'] = df['close'].rolling(window=10).mean().shift(1)
+    df['ma_20'] = df['close'].rolling(window=20).mean().shift(1)
+
+    # Añadir características de volatilidad
+    df['volatility_5'] = df['close'].rolling(window=5).std().shift(1)
+    df['volatility_10'] = df['close'].rolling(window=10).std().shift(1)
+
+    # Añadir características de RSI
+    delta = df['close'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
+    rs = gain / loss
+    df['rsi'] = 100 - (100 / (1 + rs)).shift(1)
+
+    return df
+
+
+def feature_matrix(closes, look_back):
+    """Matriz de características alineada con `closes` (fila i = barra i, con NaN si falta historial)"""
+    return _feature_frame(closes, look_back).drop('close', axis=1).values
+
+
+def batch_features(closes, look_back):
+    """
+    Calcular todas las características de una serie de cierres con pandas
+
+    Es el camino de referencia: produce exactamente las mismas filas que
+    preprocess_data_for_tree_models ha generado siempre.
+
+    Retorna:
+    - X: Matriz de características (una fila por barra con historial suficiente)
+    - y: Precio de cierre de cada fila
+    """
+    df = _feature_frame(closes, look_back)
+
+    # Eliminar filas con NaN
+    df = df.dropna()
+
+    # Separar características y objetivo
+    X = df.drop('close', axis=1).values
+    y = df['close'].values
+
+    return X, y
+
+
+class IncrementalFeatureEngine:
+    """
+    Motor de características con estado para un símbolo
+
+    Mantiene sumas móviles, sumas de cuadrados (para las varianzas) y las sumas de
+    ganancias/pérdidas del RSI, de modo que añadir una barra actualiza la última
+    fila de características en O(características) sin recalcular la serie entera.
+    La fila de la barra t solo usa cierres anteriores a t, igual que batch_features.
+    """
+
+    def __init__(self, look_back=60):
+        self.look_back = look_back
+        self.columns = feature_names(look_back)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Olvidar todo el estado acumulado"""
+        history = max(self.look_back, max(MA_WINDOWS), max(VOLATILITY_WINDOWS), RSI_WINDOW + 1)
+        self._closes = deque(maxlen=history)
+        self._deltas = deque(maxlen=RSI_WINDOW)
+        self._sums = {w: 0.0 for w in MA_WINDOWS}
+        self._sumsq = {w: 0.0 for w in VOLATILITY_WINDOWS}
+        self._gain_sum = 0.0
+        self._loss_sum = 0.0
+        self.last_timestamp = None
+        self.latest_row = None
+        self.latest_close = None
+
+    def _current_features(self):
+        """Características de la próxima barra a partir de los cierres ya vistos (None si faltan datos)"""
+        n = len(self._closes)
+        if n < self.look_back or n < max(MA_WINDOWS) or len(self._deltas) < RSI_WINDOW:
+            return None
+
+        row = np.empty(len(self.columns))
+        closes = self._closes
+        # Retardos: lag_1 es el último cierre visto
+        for i in range(1, self.look_back + 1):
+            row[i - 1] = closes[-i]
+
+        pos = self.look_back
+        for w in MA_WINDOWS:
+            row[pos] = self._sums[w] / w
+            pos += 1
+        for w in VOLATILITY_WINDOWS:
+            mean = self._sums[w] / w
+            variance = max((self._sumsq[w] - w * mean * mean) / (w - 1), 0.0)
+            row[pos] = np.sqrt(variance)
+            pos += 1
+
+        gain = self._gain_sum / RSI_WINDOW
+        loss = self._loss_sum / RSI_WINDOW
+        if loss == 0:
+            if gain == 0:
+                return None  # 0/0: el camino por lotes descarta esta fila
+            row[pos] = 100.0
+        else:
+            row[pos] = 100 - (100 / (1 + gain / loss))
+        return row
+
+    def update(self, close, timestamp=None):
+        """
+        Añadir una barra y devolver su fila de características (None si aún no hay historial suficiente)
+        """
+        close = float(close)
+        row = self._current_features()
+
+        closes = self._closes
+        # Actualizar sumas móviles quitando el cierre que sale de cada ventana
+        for w in MA_WINDOWS:
+            self._sums[w] += close
+            if len(closes) >= w:
+                self._sums[w] -= closes[-w]
+        for w in VOLATILITY_WINDOWS:
+            self._sumsq[w] += close * close
+            if len(closes) >= w:
+                self._sumsq[w] -= closes[-w] * closes[-w]
+
+        # Actualizar ganancias y pérdidas del RSI
+        if closes:
+            delta = close - closes[-1]
+            if len(self._deltas) == RSI_WINDOW:
+                old = self._deltas[0]
+                self._gain_sum -= max(old, 0.0)
+                self._loss_sum -= max(-old, 0.0)
+            self._deltas.append(delta)
+            self._gain_sum += max(delta, 0.0)
+            self._loss_sum += max(-delta, 0.0)
+
+        closes.append(close)
+        self.last_timestamp = timestamp
+        self.latest_close = close
+        self.latest_row = row
+        return row
+
+    def extend(self, closes, timestamps=None):
+        """
+        Añadir solo las barras posteriores a la última vista
+
+        Si las nuevas barras no solapan con el estado (hueco) o la última barra
+        conocida cambió de valor, se reconstruye el estado desde cero.
+        """
+        closes = np.asarray(closes, dtype=float)
+        with self._lock:
+            if timestamps is None:
+                for close in closes:
+                    self.update(close)
+                return self.latest_row
+
+            timestamps = np.asarray(timestamps)
+            if self.last_timestamp is not None:
+                overlap = np.flatnonzero(timestamps == self.last_timestamp)
+                if len(overlap) == 0 or closes[overlap[-1]] != self.latest_close:
+                    self.reset()
+                else:
+                    start = overlap[-1] + 1
+                    closes, timestamps = closes[start:], timestamps[start:]
+
+            for close, timestamp in zip(closes, timestamps):
+                self.update(close, timestamp)
+            return self.latest_row
+
+    def transform(self, closes):
+        """Modo por lotes: mismas (X, y) que batch_features"""
+        return batch_features(closes, self.look_back)
+
+
+# Estado de los motores por (símbolo, tipo de activo, look_back) compartido en el proceso
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_feature_engine(symbol, asset_type, look_back=60):
+    """Obtener (o crear) el motor incremental de un símbolo"""
+    key = (symbol, asset_type, look_back)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = IncrementalFeatureEngine(look_back)
+        return engine
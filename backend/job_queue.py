@@ -0,0 +1,393 @@
+# job_queue.py
+import os
+import json
+import queue
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+
+# Estados de un trabajo
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+# Espera tras un error inesperado en el bucle de un hilo de trabajo (p. ej., broker o base de datos caídos)
+WORKER_ERROR_BACKOFF_SECONDS = 1.0
+
+
+class QueueFullError(Exception):
+    """La cola de trabajos ha alcanzado su tamaño máximo"""
+
+
+class JobCancelledError(Exception):
+    """El trabajo se canceló mientras se ejecutaba"""
+
+
+class InProcessBroker:
+    """Cola de identificadores de trabajo en memoria (un único proceso de la API)"""
+
+    def __init__(self, max_pending=100):
+        self._queue = queue.Queue(maxsize=max_pending)
+
+    def put(self, job_id):
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            raise QueueFullError("Demasiados trabajos en cola")
+
+    def get(self, timeout=1.0):
+        """Siguiente identificador de trabajo, o None si no llega ninguno en `timeout` segundos"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def pending(self):
+        return self._queue.qsize()
+
+
+class RedisBroker:
+    """
+    Cola de identificadores de trabajo en una lista de Redis (o servidor compatible)
+
+    Permite que varios procesos de la API compartan la misma cola; el estado de cada
+    trabajo sigue estando en la base de datos. Requiere el paquete opcional `redis`.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", key="trading:jobs", max_pending=100):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.key = key
+        self.max_pending = max_pending
+
+    def put(self, job_id):
+        if self._client.llen(self.key) >= self.max_pending:
+            raise QueueFullError("Demasiados trabajos en cola")
+        self._client.rpush(self.key, job_id)
+
+    def get(self, timeout=1.0):
+        item = self._client.blpop(self.key, timeout=max(1, int(timeout)))
+        return item[1].decode() if item else None
+
+    def pending(self):
+        return self._client.llen(self.key)
+
+
+def create_broker(url=None, max_pending=100):
+    """Crear el broker indicado por la URL ('memory' o 'redis://...')"""
+    url = url or "memory"
+    if url == "memory":
+        return InProcessBroker(max_pending=max_pending)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url, max_pending=max_pending)
+    raise ValueError(f"Broker de trabajos no soportado: {url}")
+
+
+class JobContext:
+    """Información que recibe un manejador: identificador del trabajo y comprobación de cancelación"""
+
+    def __init__(self, manager, job_id):
+        self.manager = manager
+        self.job_id = job_id
+
+    def cancelled(self):
+        return self.manager.is_cancel_requested(self.job_id)
+
+    def raise_if_cancelled(self):
+        if self.cancelled():
+            raise JobCancelledError(self.job_id)
+
+
+class JobManager:
+    """
+    Trabajos en segundo plano con estado persistido en la base de datos
+
+    Las peticiones largas se registran como una fila de `job_model` y su identificador
+    se envía al broker; un pool acotado de hilos consume el broker y ejecuta el manejador
+    registrado para el tipo de trabajo con su propia sesión de base de datos.
+
+    Cancelar un trabajo en cola evita que llegue a ejecutarse. Un trabajo en ejecución se
+    marca para cancelar y se detiene en el siguiente punto de control del manejador
+    (context.raise_if_cancelled); si termina antes de llegar a uno, conserva su resultado.
+
+    Cada trabajo en ejecución guarda el proceso que lo reclamó (owner) y un latido
+    (heartbeat_at) que ese proceso renueva mientras lo ejecuta. Así, con varios procesos
+    compartiendo un RedisBroker, solo se dan por interrumpidos los trabajos de este mismo
+    proceso (tras un reinicio) o los de procesos cuyo latido ha dejado de llegar.
+    """
+
+    def __init__(self, session_factory, job_model, broker=None, max_workers=2,
+                 heartbeat_seconds=30, stale_after_seconds=120):
+        """
+        Parámetros:
+        - session_factory: Fábrica de sesiones de SQLAlchemy (SessionLocal)
+        - job_model: Modelo ORM donde se guarda el estado de los trabajos
+        - broker: InProcessBroker o RedisBroker (por defecto, en memoria)
+        - max_workers: Número máximo de trabajos ejecutándose a la vez en este proceso
+        - heartbeat_seconds: Segundos entre latidos de los trabajos en ejecución
+        - stale_after_seconds: Segundos sin latido tras los que un trabajo se da por interrumpido
+        """
+        self.session_factory = session_factory
+        self.job_model = job_model
+        self.broker = broker or InProcessBroker()
+        self.max_workers = max_workers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_after_seconds = stale_after_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}
+        self._running_jobs = set()
+        self._cancel_requested = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def register(self, kind, handler):
+        """Registrar el manejador de un tipo de trabajo: handler(params, db, context) -> resultado"""
+        self._handlers[kind] = handler
+
+    def start(self, recover=True):
+        """Arrancar los hilos de trabajo (y recuperar los trabajos que quedaron a medias)"""
+        if self._threads:
+            return
+        if recover:
+            self.recover()
+        self._stop.clear()
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logging.info(f"Cola de trabajos iniciada con {self.max_workers} hilos")
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def recover(self):
+        """
+        Reencolar los trabajos pendientes y marcar como fallidos los que quedaron interrumpidos
+
+        Se llama antes de arrancar los hilos, así que los trabajos en ejecución a nombre de
+        este proceso (mismo host y pid, p. ej. tras reiniciar el contenedor) son de una
+        ejecución anterior. Los de otros procesos solo se tocan si su latido está caducado.
+
+        Con el broker en memoria, la cola se pierde al reiniciar la API, pero el estado
+        persistido en la base de datos permite reconstruirla.
+        """
+        db = self.session_factory()
+        try:
+            self._fail_interrupted(db, include_own=True)
+            if isinstance(self.broker, InProcessBroker):
+                queued = db.query(self.job_model).filter(self.job_model.status == QUEUED) \
+                    .order_by(self.job_model.created_at).all()
+                for job in queued:
+                    self.broker.put(job.id)
+        finally:
+            db.close()
+
+    def _fail_interrupted(self, db, include_own=False):
+        """Marcar como fallidos los trabajos en ejecución sin latido reciente (y, si se pide, los propios)"""
+        stale_before = datetime.utcnow() - timedelta(seconds=self.stale_after_seconds)
+        # Filas sin latido (anteriores a la columna): se usa la hora de inicio
+        last_seen = func.coalesce(self.job_model.heartbeat_at, self.job_model.started_at)
+        condition = or_(last_seen < stale_before, last_seen.is_(None))
+        if include_own:
+            condition = or_(condition, self.job_model.owner == self.owner)
+        interrupted = db.query(self.job_model).filter(self.job_model.status == RUNNING, condition).all()
+        for job in interrupted:
+            job.status = FAILED
+            job.error = f"Trabajo interrumpido: el proceso {job.owner or 'desconocido'} dejó de ejecutarlo"
+            job.finished_at = datetime.utcnow()
+        db.commit()
+        if interrupted:
+            logging.warning(f"Trabajos interrumpidos marcados como fallidos: {[job.id for job in interrupted]}")
+        return len(interrupted)
+
+    def _heartbeat_loop(self):
+        """Renovar el latido de los trabajos de este proceso y liberar los de procesos caídos"""
+        while not self._stop.wait(self.heartbeat_seconds):
+            db = self.session_factory()
+            try:
+                with self._lock:
+                    running = list(self._running_jobs)
+                if running:
+                    db.query(self.job_model).filter(
+                        self.job_model.id.in_(running),
+                        self.job_model.owner == self.owner
+                    ).update({'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+                    db.commit()
+                self._fail_interrupted(db)
+            except Exception as e:
+                logging.error(f"Error al renovar el latido de los trabajos: {e}")
+                db.rollback()
+            finally:
+                db.close()
+
+    def submit(self, kind, params, user_id=None):
+        """
+        Registrar un trabajo y enviarlo al broker
+
+        Retorna:
+        - Identificador del trabajo
+
+        Lanza QueueFullError si la cola está llena (el trabajo queda registrado como fallido).
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+
+        job_id = uuid.uuid4().hex
+        db = self.session_factory()
+        try:
+            job = self.job_model(id=job_id, kind=kind, status=QUEUED, params=params,
+                                 user_id=user_id, created_at=datetime.utcnow())
+            db.add(job)
+            db.commit()
+            try:
+                self.broker.put(job_id)
+            except QueueFullError:
+                job.status = FAILED
+                job.error = "Cola de trabajos llena"
+                job.finished_at = datetime.utcnow()
+                db.commit()
+                raise
+        finally:
+            db.close()
+        return job_id
+
+    def get(self, job_id):
+        """Estado de un trabajo como diccionario, o None si no existe"""
+        db = self.session_factory()
+        try:
+            job = db.query(self.job_model).filter(self.job_model.id == job_id).first()
+            return self._to_dict(job) if job else None
+        finally:
+            db.close()
+
+    def cancel(self, job_id):
+        """
+        Cancelar un trabajo
+
+        Retorna:
+        - Estado del trabajo tras la petición, o None si no existe
+        """
+        db = self.session_factory()
+        try:
+            job = db.query(self.job_model).filter(self.job_model.id == job_id).first()
+            if job is None:
+                return None
+            if job.status == QUEUED:
+                job.status = CANCELLED
+                job.finished_at = datetime.utcnow()
+            elif job.status == RUNNING:
+                job.cancel_requested = True
+                with self._lock:
+                    self._cancel_requested.add(job_id)
+            db.commit()
+            return self._to_dict(job)
+        finally:
+            db.close()
+
+    def is_cancel_requested(self, job_id):
+        with self._lock:
+            if job_id in self._cancel_requested:
+                return True
+        # La cancelación puede haberse pedido desde otro proceso de la API
+        db = self.session_factory()
+        try:
+            job = db.query(self.job_model.cancel_requested).filter(self.job_model.id == job_id).first()
+            return bool(job and job.cancel_requested)
+        finally:
+            db.close()
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            try:
+                job_id = self.broker.get(timeout=1.0)
+                if job_id is not None:
+                    self._run(job_id)
+            except Exception as e:
+                # Un fallo del broker o de la base de datos no debe terminar el hilo
+                logging.error(f"Error en {threading.current_thread().name}: {e}")
+                self._stop.wait(WORKER_ERROR_BACKOFF_SECONDS)
+
+    def _claim(self, db, job_id):
+        """Pasar el trabajo de 'queued' a 'running' de forma atómica (un único consumidor lo ejecuta)"""
+        now = datetime.utcnow()
+        claimed = db.query(self.job_model).filter(
+            self.job_model.id == job_id,
+            self.job_model.status == QUEUED
+        ).update({'status': RUNNING, 'started_at': now, 'owner': self.owner, 'heartbeat_at': now},
+                 synchronize_session=False)
+        db.commit()
+        return claimed == 1
+
+    def _run(self, job_id):
+        db = self.session_factory()
+        try:
+            if not self._claim(db, job_id):
+                # Cancelado mientras estaba en cola (o ya reclamado por otro proceso)
+                return
+            with self._lock:
+                self._running_jobs.add(job_id)
+            job = db.query(self.job_model).filter(self.job_model.id == job_id).first()
+            handler = self._handlers.get(job.kind)
+            context = JobContext(self, job_id)
+            status, result, error = SUCCEEDED, None, None
+            try:
+                if handler is None:
+                    raise ValueError(f"Tipo de trabajo desconocido: {job.kind}")
+                result = handler(dict(job.params or {}), db, context)
+            except JobCancelledError:
+                db.rollback()
+                status = CANCELLED
+            except Exception as e:
+                logging.error(f"Error en el trabajo {job_id} ({job.kind}): {e}")
+                db.rollback()
+                status, error = FAILED, str(e)
+
+            job = db.query(self.job_model).filter(self.job_model.id == job_id).first()
+            job.status = status
+            job.result = json.loads(json.dumps(result, default=str)) if result is not None else None
+            job.error = error
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            with self._lock:
+                self._running_jobs.discard(job_id)
+                self._cancel_requested.discard(job_id)
+            db.close()
+
+    def _to_dict(self, job):
+        return {
+            "job_id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "cancel_requested": bool(job.cancel_requested),
+            "owner": job.owner,
+            "error": job.error,
+            "created_at": job.created_at.strftime("%Y-%m-%d %H:%M:%S") if job.created_at else None,
+            "started_at": job.started_at.strftime("%Y-%m-%d %H:%M:%S") if job.started_at else None,
+            "finished_at": job.finished_at.strftime("%Y-%m-%d %H:%M:%S") if job.finished_at else None,
+            "heartbeat_at": job.heartbeat_at.strftime("%Y-%m-%d %H:%M:%S") if job.heartbeat_at else None,
+        }
+
+    def result(self, job_id):
+        """(estado, resultado) de un trabajo, o None si no existe"""
+        db = self.session_factory()
+        try:
+            job = db.query(self.job_model).filter(self.job_model.id == job_id).first()
+            if job is None:
+                return None
+            return self._to_dict(job), job.result
+        finally:
+            db.close()
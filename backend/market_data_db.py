@@ -0,0 +1,203 @@
+# market_data_db.py
+import threading
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, cast, Float
+from market_data_store import OHLCV_COLUMNS, INTERVAL_SECONDS, YFinanceSource, CCXTSource, default_store
+
+# Columnas de datos_mercado en el orden de OHLCV_COLUMNS
+DB_COLUMNS = ['apertura', 'maximo', 'minimo', 'cierre', 'volumen']
+
+# SQLite admite como mínimo 999 parámetros por sentencia (7 por fila)
+SQLITE_MAX_VARIABLES = 999
+POSTGRES_ROWS_PER_STATEMENT = 1000
+
+# Margen al comprobar el principio del rango (fines de semana y festivos no tienen barra)
+HEAD_TOLERANCE = timedelta(days=5)
+
+
+class DatabaseOHLCVStore:
+    """
+    Caché de precios diarios en la tabla datos_mercado
+
+    Misma interfaz que OHLCVStore.get: las lecturas son una consulta por rango sobre el
+    índice único (activo_id, fecha) y solo se piden a la fuente las barras que faltan al
+    principio o al final, que se insertan con INSERT ... ON CONFLICT de varias filas.
+    La tabla solo guarda barras diarias: otros intervalos se sirven desde `fallback`.
+
+    Las descargas y escrituras de cada activo se serializan con un cerrojo propio, así
+    que una fuente lenta para un símbolo no bloquea las lecturas de los demás.
+    """
+
+    def __init__(self, engine, market_data_table, asset_table, sources=None, max_staleness=None, fallback=None):
+        """
+        Parámetros:
+        - engine: Engine de SQLAlchemy (PostgreSQL o SQLite)
+        - market_data_table: Tabla datos_mercado (MarketData.__table__)
+        - asset_table: Tabla activos (Asset.__table__)
+        - sources: Diccionario {asset_type: fuente} con objetos que implementan fetch()
+        - max_staleness: Segundos que se consideran frescos los datos (por defecto, un día)
+        - fallback: Almacén para intervalos distintos de '1d' (por defecto, el de ficheros)
+        """
+        if engine.dialect.name not in ('postgresql', 'sqlite'):
+            raise ValueError(f"Base de datos no soportada para datos_mercado: {engine.dialect.name}")
+        self.engine = engine
+        self.table = market_data_table
+        self.assets = asset_table
+        self.sources = sources or {'stock': YFinanceSource(), 'crypto': CCXTSource()}
+        self.max_staleness = max_staleness
+        self.fallback = fallback or default_store
+        self._asset_ids = {}
+        self._covered_from = {}  # {activo_id: inicio ya pedido a la fuente}
+        self._checked_at = {}  # {activo_id: última comprobación de la cola}
+        self._locks = {}  # {activo_id: cerrojo de sus descargas}
+        self._lock = threading.Lock()
+
+    def _asset_lock(self, asset_id):
+        """Cerrojo de las descargas y escrituras de un activo"""
+        with self._lock:
+            return self._locks.setdefault(asset_id, threading.Lock())
+
+    def asset_id(self, symbol, asset_type='stock'):
+        """Id del activo en la tabla activos, dándolo de alta si todavía no existe"""
+        asset_id = self._asset_ids.get(symbol)
+        if asset_id is not None:
+            return asset_id
+        with self.engine.begin() as conn:
+            asset_id = conn.execute(select(self.assets.c.id).where(self.assets.c.simbolo == symbol)).scalar()
+            if asset_id is None:
+                result = conn.execute(self.assets.insert().values(simbolo=symbol, nombre=symbol, tipo=asset_type))
+                asset_id = result.inserted_primary_key[0]
+        self._asset_ids[symbol] = asset_id
+        return asset_id
+
+    def _insert_statement(self):
+        if self.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(self.table)
+
+    def upsert_bars(self, asset_id, data):
+        """
+        Insertar o actualizar barras con sentencias INSERT ... ON CONFLICT de varias filas
+
+        Parámetros:
+        - asset_id: Id del activo
+        - data: DataFrame indexado por fecha con columnas open, high, low, close, volume
+
+        Retorna:
+        - Número de barras escritas
+        """
+        if data is None or data.empty:
+            return 0
+        values = data[OHLCV_COLUMNS].to_numpy(dtype=np.float64)
+        dates = pd.to_datetime(data.index).to_pydatetime()
+        rows = [
+            {'activo_id': asset_id, 'fecha': date, **dict(zip(DB_COLUMNS, map(float, row)))}
+            for date, row in zip(dates, values)
+        ]
+
+        if self.engine.dialect.name == 'sqlite':
+            chunk_size = SQLITE_MAX_VARIABLES // (len(DB_COLUMNS) + 2)
+        else:
+            chunk_size = POSTGRES_ROWS_PER_STATEMENT
+
+        with self.engine.begin() as conn:
+            for i in range(0, len(rows), chunk_size):
+                stmt = self._insert_statement().values(rows[i:i + chunk_size])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['activo_id', 'fecha'],
+                    set_={column: stmt.excluded[column] for column in DB_COLUMNS}
+                )
+                conn.execute(stmt)
+        return len(rows)
+
+    def load_arrays(self, asset_id, start=None, end=None):
+        """
+        Leer un rango de barras como arrays de NumPy
+
+        Retorna:
+        - (marcas de tiempo datetime64[ns], matriz float64 n x 5 en el orden de OHLCV_COLUMNS)
+        """
+        query = select(self.table.c.fecha, *[cast(self.table.c[column], Float) for column in DB_COLUMNS]) \
+            .where(self.table.c.activo_id == asset_id)
+        if start is not None:
+            query = query.where(self.table.c.fecha >= start)
+        if end is not None:
+            query = query.where(self.table.c.fecha <= end)
+        with self.engine.connect() as conn:
+            rows = conn.execute(query.order_by(self.table.c.fecha)).fetchall()
+
+        if not rows:
+            return np.empty(0, dtype='datetime64[ns]'), np.empty((0, len(OHLCV_COLUMNS)))
+        columns = list(zip(*rows))
+        timestamps = np.array(columns[0], dtype='datetime64[ns]')
+        values = np.array(columns[1:], dtype=np.float64).T
+        return timestamps, values
+
+    def _bounds(self, asset_id):
+        query = select(func.min(self.table.c.fecha), func.max(self.table.c.fecha)) \
+            .where(self.table.c.activo_id == asset_id)
+        with self.engine.connect() as conn:
+            return conn.execute(query).first()
+
+    def _fetch(self, symbol, asset_type, start, end=None):
+        logging.info(f"Descargando {symbol} (1d) desde {start} hasta {end or 'ahora'} para datos_mercado")
+        return self.sources[asset_type].fetch(symbol, '1d', start, end)
+
+    def ingest(self, symbol, asset_type='stock', start=None, end=None):
+        """Descargar un rango de la fuente y guardarlo en datos_mercado; retorna las barras escritas"""
+        start = pd.Timestamp(start).to_pydatetime() if start is not None else datetime.now() - timedelta(days=365)
+        end = pd.Timestamp(end).to_pydatetime() if end is not None else None
+        asset_id = self.asset_id(symbol, asset_type)
+        with self._asset_lock(asset_id):
+            written = self.upsert_bars(asset_id, self._fetch(symbol, asset_type, start, end))
+            self._covered_from[asset_id] = min(start, self._covered_from.get(asset_id, start))
+            if end is None:
+                self._checked_at[asset_id] = datetime.now()
+        return written
+
+    def get(self, symbol, asset_type='stock', start=None, end=None, interval='1d'):
+        """
+        Obtener barras OHLCV para un rango, descargando solo las que faltan en la tabla
+
+        Retorna:
+        - DataFrame indexado por fecha con columnas open, high, low, close, volume
+        """
+        if interval != '1d':
+            return self.fallback.get(symbol, asset_type, start=start, end=end, interval=interval)
+
+        now = datetime.now()
+        start = pd.Timestamp(start).to_pydatetime() if start is not None else now - timedelta(days=365)
+        end = pd.Timestamp(end).to_pydatetime() if end is not None else None
+        staleness = timedelta(seconds=self.max_staleness or INTERVAL_SECONDS['1d'])
+        asset_id = self.asset_id(symbol, asset_type)
+
+        with self._asset_lock(asset_id):
+            first, last = self._bounds(asset_id)
+            if first is None:
+                # Arranque en frío: descargar el rango completo
+                self.upsert_bars(asset_id, self._fetch(symbol, asset_type, start, end))
+                self._covered_from[asset_id] = start
+                self._checked_at[asset_id] = min(end, now) if end is not None else now
+            else:
+                # Completar el principio del rango si se piden fechas más antiguas
+                covered_from = self._covered_from.get(asset_id, first)
+                if start < covered_from - HEAD_TOLERANCE:
+                    self.upsert_bars(asset_id, self._fetch(symbol, asset_type, start, first))
+                    self._covered_from[asset_id] = start
+
+                # Completar la cola solo si los datos ya no están frescos
+                checked_at = self._checked_at.get(asset_id, last)
+                target_end = min(end, now) if end is not None else now
+                if target_end - checked_at > staleness:
+                    # Se vuelve a pedir la última barra porque podía estar incompleta
+                    self.upsert_bars(asset_id, self._fetch(symbol, asset_type, last, end))
+                    self._checked_at[asset_id] = target_end
+
+        timestamps, values = self.load_arrays(asset_id, start, end)
+        df = pd.DataFrame(values, columns=OHLCV_COLUMNS, index=pd.DatetimeIndex(timestamps, name='timestamp'))
+        return df
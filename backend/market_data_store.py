@@ -0,0 +1,316 @@
+# market_data_store.py
+import os
+import json
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+import yfinance as yf
+import ccxt
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se sincronizan los hilos del proceso
+    fcntl = None
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# Duración de cada intervalo en segundos (se usa para decidir si los datos locales están al día)
+INTERVAL_SECONDS = {
+    '1m': 60,
+    '5m': 5 * 60,
+    '15m': 15 * 60,
+    '30m': 30 * 60,
+    '1h': 3600,
+    '4h': 4 * 3600,
+    '1d': 24 * 3600,
+    '1wk': 7 * 24 * 3600,
+}
+
+
+def period_to_timedelta(period):
+    """Convertir un periodo de yfinance ('60d', '1y', '6mo', 'ytd', 'max') a timedelta"""
+    now = datetime.now()
+    if period == 'max':
+        return now - datetime(1970, 1, 1)
+    if period == 'ytd':
+        return now - datetime(now.year, 1, 1)
+    if period.endswith('mo'):
+        return timedelta(days=30 * int(period[:-2]))
+    if period.endswith('wk'):
+        return timedelta(weeks=int(period[:-2]))
+    if period.endswith('y'):
+        return timedelta(days=365 * int(period[:-1]))
+    if period.endswith('d'):
+        return timedelta(days=int(period[:-1]))
+    raise ValueError(f"Periodo no soportado: {period}")
+
+
+def _normalize_frame(df):
+    """Normalizar un DataFrame OHLCV: columnas en minúsculas e índice de fechas UTC sin zona horaria"""
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df = df.rename(columns=str.lower)
+    index = pd.to_datetime(df.index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    df.index = index
+    df.index.name = 'timestamp'
+    return df[OHLCV_COLUMNS].astype(float)
+
+
+class YFinanceSource:
+    """Fuente de datos de acciones usando yfinance"""
+
+    def fetch(self, symbol, interval, start, end=None):
+        data = yf.download(symbol, start=start, end=end, interval=interval, progress=False)
+        if len(data) == 0:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        return _normalize_frame(data)
+
+
+class CCXTSource:
+    """Fuente de datos de criptomonedas usando ccxt (Binance por defecto)"""
+
+    def __init__(self, exchange_id='binance', page_limit=1000):
+        self.exchange_id = exchange_id
+        self.page_limit = page_limit
+        self._exchange = None
+
+    @property
+    def exchange(self):
+        if self._exchange is None:
+            self._exchange = getattr(ccxt, self.exchange_id)()
+        return self._exchange
+
+    def fetch(self, symbol, interval, start, end=None):
+        since = int(pd.Timestamp(start).timestamp() * 1000)
+        until = int(pd.Timestamp(end).timestamp() * 1000) if end is not None else None
+        rows = []
+        # Paginar hasta agotar los datos disponibles
+        while True:
+            batch = self.exchange.fetch_ohlcv(symbol, interval, since=since, limit=self.page_limit)
+            if not batch:
+                break
+            rows.extend(batch)
+            last_ts = batch[-1][0]
+            if len(batch) < self.page_limit or (until is not None and last_ts >= until):
+                break
+            since = last_ts + 1
+
+        df = pd.DataFrame(rows, columns=['timestamp'] + OHLCV_COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        df = df.set_index('timestamp')
+        if until is not None:
+            df = df[df.index <= pd.to_datetime(until, unit='ms')]
+        return df.astype(float)
+
+
+class FakeOHLCVSource:
+    """
+    Fuente de datos sintética y determinista para pruebas sin conexión
+
+    Genera un paseo aleatorio por símbolo sobre una rejilla regular del intervalo
+    y registra cada llamada en `calls` para poder contar las peticiones de red.
+    """
+
+    def __init__(self, seed=42, start_price=100.0, now=None):
+        self.seed = seed
+        self.start_price = start_price
+        self.now = now
+        self.calls = []
+
+    def fetch(self, symbol, interval, start, end=None):
+        self.calls.append({'symbol': symbol, 'interval': interval, 'start': start, 'end': end})
+        step = INTERVAL_SECONDS[interval]
+        origin = datetime(2000, 1, 1)
+        end = end if end is not None else (self.now or datetime.now())
+        first = max(0, int(np.ceil((pd.Timestamp(start) - origin).total_seconds() / step)))
+        last = int((pd.Timestamp(end) - origin).total_seconds() // step)
+        if last < first:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+
+        # El precio de la barra i depende solo de (símbolo, i) para que las descargas parciales encajen
+        steps = np.arange(first, last + 1)
+        phase = (sum(map(ord, symbol)) + self.seed) % 997
+        close = self.start_price * (1 + 0.2 * np.sin((steps + phase) / 25.0) + 0.0005 * steps)
+        df = pd.DataFrame({
+            'open': close * 0.995,
+            'high': close * 1.01,
+            'low': close * 0.99,
+            'close': close,
+            'volume': 1000.0 + (steps % 100),
+        }, index=pd.to_datetime(origin) + pd.to_timedelta(steps * step, unit='s'))
+        df.index.name = 'timestamp'
+        return df
+
+
+@contextmanager
+def _file_lock(path):
+    """Cerrojo exclusivo entre procesos sobre un fichero auxiliar (flock)"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class OHLCVStore:
+    """
+    Almacén local de barras OHLCV en arrays NumPy mapeados en memoria
+
+    Cada par (símbolo, intervalo) se guarda en dos ficheros .npy (marcas de tiempo
+    y matriz OHLCV) más un fichero JSON con el rango ya consultado a la fuente.
+    Las lecturas consultan primero el disco y solo piden a la fuente las barras
+    que faltan al principio o al final del rango.
+
+    Cada lectura-descarga-escritura se hace con un cerrojo de fichero por (símbolo,
+    intervalo), de modo que varios procesos (por ejemplo, el pool de backtesting)
+    pueden compartir el mismo directorio sin pisarse los ficheros.
+    """
+
+    def __init__(self, base_dir="market_data", sources=None, max_staleness=None):
+        """
+        Parámetros:
+        - base_dir: Directorio donde se guardan los ficheros
+        - sources: Diccionario {asset_type: fuente} con objetos que implementan fetch()
+        - max_staleness: Segundos que se consideran frescos los datos locales (por defecto, un intervalo)
+        """
+        self.base_dir = base_dir
+        self.sources = sources or {'stock': YFinanceSource(), 'crypto': CCXTSource()}
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+
+    def _base(self, symbol, interval):
+        return os.path.join(self.base_dir, f"{symbol.replace('/', '-')}_{interval}")
+
+    def _paths(self, symbol, interval):
+        base = self._base(symbol, interval)
+        return f"{base}_ts.npy", f"{base}_ohlcv.npy", f"{base}_meta.json"
+
+    def array_paths(self, symbol, interval='1d'):
+        """Rutas de los ficheros .npy (marcas de tiempo, OHLCV) para abrirlos con np.load(mmap_mode='r')"""
+        ts_path, ohlcv_path, _ = self._paths(symbol, interval)
+        return ts_path, ohlcv_path
+
+    def _read(self, symbol, interval):
+        ts_path, ohlcv_path, meta_path = self._paths(symbol, interval)
+        if not (os.path.exists(ts_path) and os.path.exists(ohlcv_path) and os.path.exists(meta_path)):
+            return None, None, None
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        ts, values = np.load(ts_path, mmap_mode='r'), np.load(ohlcv_path, mmap_mode='r')
+        if len(ts) != len(values):
+            # Escritura interrumpida entre los dos arrays: se vuelve a descargar
+            logging.warning(f"Ficheros de {symbol} ({interval}) inconsistentes, se descartan")
+            return None, None, None
+        return ts, values, meta
+
+    def _write(self, symbol, interval, ts, values, meta):
+        # Nombre temporal único por escritura; el fichero de metadatos se sustituye el último
+        for path, payload in zip(self._paths(symbol, interval), (ts, values, meta)):
+            fd, tmp_path = tempfile.mkstemp(dir=self.base_dir, prefix=f"{os.path.basename(path)}.",
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb' if path.endswith('.npy') else 'w') as f:
+                    if path.endswith('.npy'):
+                        np.save(f, payload)
+                    else:
+                        json.dump(payload, f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def _fetch(self, symbol, asset_type, interval, start, end=None):
+        logging.info(f"Descargando {symbol} ({interval}) desde {start} hasta {end or 'ahora'}")
+        df = self.sources[asset_type].fetch(symbol, interval, start, end)
+        ts = df.index.values.astype('datetime64[ns]').astype(np.int64)
+        return ts, df[OHLCV_COLUMNS].to_numpy(dtype=np.float64)
+
+    def get(self, symbol, asset_type='stock', start=None, end=None, interval='1d'):
+        """
+        Obtener barras OHLCV para un rango, descargando solo las que faltan
+
+        Parámetros:
+        - symbol: Símbolo del activo
+        - asset_type: 'stock' o 'crypto' (elige la fuente)
+        - start: Fecha de inicio (datetime o str)
+        - end: Fecha de fin (None = hasta ahora)
+        - interval: Intervalo de las barras ('1d', '1h', ...)
+
+        Retorna:
+        - DataFrame indexado por fecha con columnas open, high, low, close, volume
+        """
+        now = datetime.now()
+        start = pd.Timestamp(start).to_pydatetime() if start is not None else now - timedelta(days=365)
+        end = pd.Timestamp(end).to_pydatetime() if end is not None else None
+        staleness = timedelta(seconds=self.max_staleness or INTERVAL_SECONDS.get(interval, 24 * 3600))
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        with self._lock, _file_lock(f"{self._base(symbol, interval)}.lock"):
+            ts, values, meta = self._read(symbol, interval)
+            pieces = []
+
+            if ts is None or len(ts) == 0:
+                # Arranque en frío: descargar el rango completo
+                pieces.append(self._fetch(symbol, asset_type, interval, start, end))
+                meta = {'covered_from': start.isoformat(), 'checked_at': (end or now).isoformat()}
+            else:
+                covered_from = datetime.fromisoformat(meta['covered_from'])
+                checked_at = datetime.fromisoformat(meta['checked_at'])
+                pieces.append((np.array(ts), np.array(values)))
+
+                # Completar el principio del rango si se piden fechas más antiguas
+                if start < covered_from:
+                    pieces.append(self._fetch(symbol, asset_type, interval, start, covered_from))
+                    meta['covered_from'] = start.isoformat()
+
+                # Completar la cola solo si los datos locales ya no están frescos
+                target_end = min(end, now) if end is not None else now
+                if target_end - checked_at > staleness:
+                    # Se vuelve a pedir la última barra porque podía estar incompleta
+                    tail_start = pd.to_datetime(int(ts[-1])).to_pydatetime()
+                    pieces.append(self._fetch(symbol, asset_type, interval, tail_start, end))
+                    meta['checked_at'] = target_end.isoformat()
+
+            if len(pieces) > 1 or ts is None or len(ts) == 0:
+                all_ts = np.concatenate([p[0] for p in pieces])
+                all_values = np.concatenate([p[1].reshape(-1, len(OHLCV_COLUMNS)) for p in pieces])
+                # Las barras descargadas más tarde sustituyen a las guardadas con la misma fecha
+                order = np.argsort(all_ts, kind='stable')
+                all_ts, all_values = all_ts[order], all_values[order]
+                keep = np.append(all_ts[1:] != all_ts[:-1], True)
+                ts, values = all_ts[keep], all_values[keep]
+                self._write(symbol, interval, ts, values, meta)
+
+            lo = np.searchsorted(ts, np.datetime64(start, 'ns').astype(np.int64), side='left')
+            hi = len(ts) if end is None else np.searchsorted(ts, np.datetime64(end, 'ns').astype(np.int64), side='right')
+            df = pd.DataFrame(np.array(values[lo:hi]), columns=OHLCV_COLUMNS,
+                              index=pd.to_datetime(np.array(ts[lo:hi])))
+            df.index.name = 'timestamp'
+            return df
+
+
+# Almacén compartido por defecto para todo el proceso
+default_store = OHLCVStore(os.getenv("MARKET_DATA_DIR", "market_data"))
+_active_store = default_store
+
+
+def get_default_store():
+    """Almacén que usan por defecto el predictor, el backtester y el simulador"""
+    return _active_store
+
+
+def set_default_store(store):
+    """Sustituir el almacén por defecto (por ejemplo, por la tabla datos_mercado de la API)"""
+    global _active_store
+    _active_store = store or default_store
@@ -0,0 +1,171 @@
+# market_stream.py
+import asyncio
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+from market_data_store import get_default_store
+
+# Tamaño de la cola de cada suscriptor: si un cliente no consume, se descartan sus eventos más antiguos
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class PredictionPending(Exception):
+    """predict_fn no puede predecir todavía (por ejemplo, el modelo se está entrenando)"""
+
+    def __init__(self, message, info=None):
+        super().__init__(message)
+        self.info = info or {}
+
+
+class _Feed:
+    """Cálculo compartido de un (símbolo, tipo de activo, modelo) y sus suscriptores"""
+
+    def __init__(self, key):
+        self.key = key
+        self.subscribers = set()
+        self.task = None
+        self.last_bar = None
+        self.predicted_bar = None  # Última barra con predicción publicada
+        self.snapshot = {}  # Último evento de cada tipo, para los suscriptores que llegan tarde
+
+
+class StreamHub:
+    """
+    Difusión de barras nuevas, predicciones y ejecuciones simuladas a los clientes suscritos
+
+    Cada (símbolo, tipo de activo, modelo) tiene una única tarea que consulta el almacén
+    de datos y, solo cuando aparece una barra nueva (o cambia la última), calcula una
+    predicción; el resultado se copia en la cola de todos sus suscriptores. La tarea se
+    crea con el primer suscriptor y se cancela cuando se va el último.
+
+    Las ejecuciones de la simulación se publican desde otros hilos con publish_threadsafe.
+    """
+
+    def __init__(self, predict_fn, data_store=None, poll_seconds=60, interval='1d', lookback_days=10):
+        """
+        Parámetros:
+        - predict_fn: Función (symbol, asset_type, model_type) -> diccionario de predicción;
+          si lanza PredictionPending se publica un evento 'pending' y se reintenta en la
+          siguiente consulta
+        - data_store: Almacén OHLCV del que se leen las barras (por defecto, el compartido)
+        - poll_seconds: Segundos entre consultas al almacén
+        - interval: Intervalo de las barras
+        - lookback_days: Días de historial que se leen en cada consulta
+        """
+        self.predict_fn = predict_fn
+        self.data_store = data_store or get_default_store()
+        self.poll_seconds = poll_seconds
+        self.interval = interval
+        self.lookback_days = lookback_days
+        self._feeds = {}
+        self._loop = None
+
+    def subscribe(self, key, queue):
+        """Añadir la cola de un cliente a un flujo (debe llamarse desde el bucle de eventos)"""
+        self._loop = asyncio.get_running_loop()
+        feed = self._feeds.get(key)
+        if feed is None:
+            feed = self._feeds[key] = _Feed(key)
+            feed.task = asyncio.create_task(self._run_feed(feed))
+        feed.subscribers.add(queue)
+        for event in feed.snapshot.values():
+            _offer(queue, event)
+
+    def unsubscribe(self, key, queue):
+        """Quitar la cola de un cliente de un flujo, parando el cálculo si era el último"""
+        feed = self._feeds.get(key)
+        if feed is None:
+            return
+        feed.subscribers.discard(queue)
+        if not feed.subscribers:
+            feed.task.cancel()
+            del self._feeds[key]
+
+    def publish(self, symbol, event):
+        """Enviar un evento a todos los suscriptores de un símbolo (desde el bucle de eventos)"""
+        for feed in list(self._feeds.values()):
+            if feed.key[0] == symbol:
+                self._broadcast(feed, event)
+
+    def publish_threadsafe(self, symbol, event):
+        """Enviar un evento desde otro hilo (por ejemplo, una ejecución de la simulación)"""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.publish, symbol, event)
+
+    def stats(self):
+        return {
+            "feeds": len(self._feeds),
+            "subscribers": sum(len(feed.subscribers) for feed in self._feeds.values()),
+            "keys": [list(key) for key in self._feeds]
+        }
+
+    def _broadcast(self, feed, event):
+        if event["type"] in ("bar", "prediction"):
+            feed.snapshot[event["type"]] = event
+        for queue in feed.subscribers:
+            _offer(queue, event)
+
+    def _latest_bar(self, symbol, asset_type):
+        data = self.data_store.get(symbol, asset_type, start=datetime.now() - timedelta(days=self.lookback_days),
+                                   interval=self.interval)
+        if data.empty:
+            return None
+        timestamp = data.index[-1]
+        row = data.iloc[-1]
+        return {
+            "timestamp": timestamp.isoformat(),
+            "open": float(row['open']),
+            "high": float(row['high']),
+            "low": float(row['low']),
+            "close": float(row['close']),
+            "volume": float(row['volume']),
+        }
+
+    async def _run_feed(self, feed):
+        symbol, asset_type, model_type = feed.key
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Lectura y predicción bloqueantes fuera del bucle de eventos
+                bar = await loop.run_in_executor(None, self._latest_bar, symbol, asset_type)
+                if bar is not None and bar != feed.last_bar:
+                    feed.last_bar = bar
+                    self._broadcast(feed, {"type": "bar", "symbol": symbol, "asset_type": asset_type, **bar})
+
+                if bar is not None and bar != feed.predicted_bar:
+                    prediction = await loop.run_in_executor(None, self.predict_fn, symbol, asset_type, model_type)
+                    feed.predicted_bar = bar
+                    self._broadcast(feed, {"type": "prediction", "symbol": symbol, "asset_type": asset_type,
+                                           "model_type": model_type, "bar_timestamp": bar["timestamp"],
+                                           **_jsonable(prediction)})
+            except asyncio.CancelledError:
+                raise
+            except PredictionPending as e:
+                self._broadcast(feed, {"type": "pending", "symbol": symbol, "model_type": model_type,
+                                       "detail": str(e), **e.info})
+            except Exception as e:
+                logging.error(f"Error en el flujo de {symbol} ({model_type}): {e}")
+                self._broadcast(feed, {"type": "error", "symbol": symbol, "detail": str(e)})
+            await asyncio.sleep(self.poll_seconds)
+
+
+def _offer(queue, event):
+    """Encolar sin bloquear, descartando el evento más antiguo si el cliente va retrasado"""
+    if queue.full():
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(event)
+
+
+def _jsonable(values):
+    """Convertir escalares de NumPy y fechas a tipos serializables en JSON"""
+    result = {}
+    for name, value in values.items():
+        if isinstance(value, np.generic):
+            value = value.item()
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        result[name] = value
+    return result
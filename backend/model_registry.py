@@ -0,0 +1,144 @@
+# model_registry.py
+import os
+import threading
+import logging
+from collections import OrderedDict
+from prediction_model import TradingPredictor
+from single_flight import SingleFlight
+
+
+class ModelRegistry:
+    """
+    Registro en memoria de predictores ya cargados, compartido por todo el proceso
+
+    Las entradas se indexan por (símbolo, tipo de activo, tipo de modelo) y se
+    expulsan en orden LRU cuando se supera el número máximo de entradas o el
+    presupuesto de memoria (estimado por el tamaño de los ficheros del modelo).
+    Una entrada se invalida cuando cambia el fichero de timestamp del modelo,
+    es decir, cuando otro proceso o petición lo ha reentrenado.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=None, model_dir="models"):
+        """
+        Parámetros:
+        - max_entries: Número máximo de predictores en memoria
+        - max_bytes: Presupuesto de memoria aproximado en bytes (None = sin límite)
+        - model_dir: Directorio donde TradingPredictor guarda los modelos
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.model_dir = model_dir
+        self._entries = OrderedDict()  # {key: {'predictor': p, 'token': t, 'bytes': n}}
+        self._lock = threading.Lock()
+        self._loads = SingleFlight()  # Cargas de disco en curso por clave
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _artifact_paths(self, symbol, asset_type, model_type):
+        prefix = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{model_type}")
+        return [f"{prefix}.keras", f"{prefix}.pkl", f"{prefix}_scaler.pkl"]
+
+    def _token(self, symbol, asset_type, model_type):
+        """Firma del fichero de timestamp: cambia cada vez que el modelo se vuelve a entrenar"""
+        timestamp_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{model_type}_timestamp.txt")
+        try:
+            stat = os.stat(timestamp_filename)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _estimate_bytes(self, symbol, asset_type, model_type):
+        return sum(os.path.getsize(path) for path in self._artifact_paths(symbol, asset_type, model_type)
+                   if os.path.exists(path))
+
+    def get(self, symbol, asset_type, model_type):
+        """
+        Obtener un predictor cargado, leyendo el modelo de disco solo si no está en memoria
+
+        Retorna:
+        - TradingPredictor con el modelo cargado, o None si el modelo no existe en disco
+        """
+        key = (symbol, asset_type, model_type)
+        token = self._token(symbol, asset_type, model_type)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['token'] == token:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry['predictor']
+                # El modelo ha cambiado en disco: descartar la copia en memoria
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses += 1
+
+        def load():
+            predictor = TradingPredictor(model_type=model_type, model_dir=self.model_dir)
+            if not predictor.load_model(symbol, asset_type):
+                return None
+            self.put(symbol, asset_type, model_type, predictor, token=token)
+            return predictor
+
+        # Varios fallos simultáneos de la misma clave leen el modelo de disco una sola vez
+        predictor, _ = self._loads.do((key, token), load)
+        return predictor
+
+    def put(self, symbol, asset_type, model_type, predictor, token=None):
+        """Registrar un predictor (por ejemplo, recién entrenado) y aplicar la política de expulsión"""
+        key = (symbol, asset_type, model_type)
+        if token is None:
+            token = self._token(symbol, asset_type, model_type)
+        size = self._estimate_bytes(symbol, asset_type, model_type)
+
+        with self._lock:
+            self._entries[key] = {'predictor': predictor, 'token': token, 'bytes': size}
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self.total_bytes() > self.max_bytes)
+        ):
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            logging.info(f"Modelo expulsado del registro: {key}")
+
+    def invalidate(self, symbol=None, asset_type=None, model_type=None):
+        """Eliminar una entrada concreta, o todas si no se indica clave"""
+        with self._lock:
+            if symbol is None:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            elif self._entries.pop((symbol, asset_type, model_type), None) is not None:
+                self.invalidations += 1
+
+    def total_bytes(self):
+        return sum(entry['bytes'] for entry in self._entries.values())
+
+    def stats(self):
+        """Contadores de aciertos, fallos y ocupación del registro"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "coalesced_loads": self._loads.coalesced,
+                "keys": [list(key) for key in self._entries],
+            }
+
+
+# Registro compartido por defecto para todo el proceso
+_max_mb = os.getenv("MODEL_REGISTRY_MAX_MB")
+model_registry = ModelRegistry(
+    max_entries=int(os.getenv("MODEL_REGISTRY_MAX_ENTRIES", 32)),
+    max_bytes=int(float(_max_mb) * 1024 * 1024) if _max_mb else None
+)
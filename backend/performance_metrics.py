@@ -0,0 +1,101 @@
+# performance_metrics.py
+import numpy as np
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def drawdown_series(values):
+    """Drawdown (%) de cada punto de la curva de capital respecto al máximo anterior"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return values
+    return (values / np.maximum.accumulate(values) - 1) * 100
+
+
+def max_drawdown_duration(values):
+    """Mayor número de periodos consecutivos por debajo del máximo anterior"""
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return 0
+    peaks = np.flatnonzero(values >= np.maximum.accumulate(values))
+    gaps = np.diff(np.append(peaks, len(values))) - 1
+    return int(gaps.max())
+
+
+def round_trip_win_rate(trade_types, trade_prices, trade_symbols=None):
+    """
+    Porcentaje de operaciones completas (compra seguida de venta) cerradas con ganancia
+
+    Cada venta se empareja con la última compra del mismo símbolo posterior a la venta
+    anterior, por lo que no hace falta que compras y ventas alternen estrictamente.
+    """
+    types = np.asarray(trade_types)
+    prices = np.asarray(trade_prices, dtype=float)
+    if len(types) == 0:
+        return 0.0
+
+    if trade_symbols is not None:
+        symbols = np.asarray(trade_symbols)
+        # Ordenar de forma estable por símbolo para que cada grupo quede contiguo
+        order = np.argsort(symbols, kind='stable')
+        types, prices, symbols = types[order], prices[order], symbols[order]
+        group_start = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+        group_id = np.repeat(group_start, np.diff(np.r_[group_start, len(symbols)]))
+    else:
+        group_id = np.zeros(len(types), dtype=int)
+
+    positions = np.arange(len(types))
+    is_buy = types == 'buy'
+    is_sell = types == 'sell'
+    # Última compra y última venta vistas hasta cada posición (sin salir del grupo)
+    last_buy = np.maximum.accumulate(np.where(is_buy, positions, -1))
+    last_sell = np.maximum.accumulate(np.where(is_sell, positions, -1))
+    prev_sell = np.r_[-1, last_sell[:-1]]
+    paired = is_sell & (last_buy >= group_id) & (last_buy > prev_sell)
+
+    round_trips = int(paired.sum())
+    if round_trips == 0:
+        return 0.0
+    wins = int((prices[paired] > prices[last_buy[paired]]).sum())
+    return wins / round_trips * 100
+
+
+def compute_performance_metrics(values, trade_types=None, trade_prices=None, trade_symbols=None,
+                                periods_per_year=TRADING_DAYS_PER_YEAR):
+    """
+    Calcular las métricas de rendimiento de una curva de capital con NumPy
+
+    Parámetros:
+    - values: Valor del portafolio en cada periodo
+    - trade_types: Tipo de cada operación ('buy' / 'sell'), en orden cronológico
+    - trade_prices: Precio de cada operación
+    - trade_symbols: Símbolo de cada operación (opcional, para carteras con varios activos)
+    - periods_per_year: Periodos por año para anualizar
+
+    Retorna:
+    - Diccionario con total_return, annualized_return, annualized_volatility, sharpe_ratio,
+      sortino_ratio, max_drawdown, max_drawdown_duration, num_trades y win_rate
+    """
+    values = np.asarray(values, dtype=float)
+    returns = values[1:] / values[:-1] - 1 if len(values) > 1 else np.empty(0)
+
+    mean_return = returns.mean() if len(returns) else 0.0
+    std_return = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    annualized_return = (1 + mean_return) ** periods_per_year - 1
+    annualized_volatility = std_return * np.sqrt(periods_per_year)
+    downside_deviation = np.sqrt(np.mean(np.minimum(returns, 0) ** 2)) * np.sqrt(periods_per_year) if len(returns) else 0.0
+
+    drawdown = drawdown_series(values)
+    num_trades = len(trade_types) if trade_types is not None else 0
+
+    return {
+        'total_return': float((values[-1] - values[0]) / values[0] * 100) if len(values) else 0.0,
+        'annualized_return': float(annualized_return),
+        'annualized_volatility': float(annualized_volatility),
+        'sharpe_ratio': float(annualized_return / annualized_volatility) if annualized_volatility != 0 else 0.0,
+        'sortino_ratio': float(annualized_return / downside_deviation) if downside_deviation != 0 else 0.0,
+        'max_drawdown': float(drawdown.min()) if len(drawdown) else 0.0,
+        'max_drawdown_duration': max_drawdown_duration(values),
+        'num_trades': num_trades,
+        'win_rate': float(round_trip_win_rate(trade_types, trade_prices, trade_symbols)) if num_trades else 0.0,
+    }
@@ -0,0 +1,105 @@
+# portfolio_valuation.py
+from decimal import Decimal
+from sqlalchemy import func, select
+
+
+def _supports_window_functions(dialect):
+    """SQLite admite funciones de ventana desde la versión 3.25"""
+    if dialect.name != 'sqlite':
+        return True
+    return dialect.dbapi.sqlite_version_info >= (3, 25, 0)
+
+
+def _latest_rows(dialect, columns, partition_column, order_columns, where):
+    """
+    Subconsulta con la fila más reciente de cada partición
+
+    PostgreSQL usa DISTINCT ON; el resto, ROW_NUMBER() OVER (PARTITION BY ...).
+    Retorna None si la base de datos no admite ninguna de las dos (SQLite antiguo).
+    """
+    if dialect.name == 'postgresql':
+        return select(*columns).where(where) \
+            .distinct(partition_column) \
+            .order_by(partition_column, *[column.desc() for column in order_columns]) \
+            .subquery()
+    if _supports_window_functions(dialect):
+        row_number = func.row_number().over(
+            partition_by=partition_column,
+            order_by=[column.desc() for column in order_columns]
+        ).label('rn')
+        ranked = select(*columns, row_number).where(where).subquery()
+        return select(*[ranked.c[column.key] for column in columns]).where(ranked.c.rn == 1).subquery()
+    return None
+
+
+def position_prices_query(dialect, account_id, position_model, operation_model, market_data_model=None):
+    """
+    Consulta única con (asset_id, quantity, price) de cada posición de una cuenta
+
+    El precio es el de la última operación de la cuenta en ese activo o, si se indica
+    market_data_model, el último cierre guardado en datos_mercado (con la última
+    operación como respaldo cuando el activo no tiene precios guardados).
+    """
+    Position, Operation = position_model, operation_model
+    last_fill = _latest_rows(
+        dialect,
+        [Operation.asset_id, Operation.price],
+        Operation.asset_id,
+        [Operation.timestamp, Operation.id],
+        Operation.account_id == account_id
+    )
+
+    if last_fill is not None:
+        fill_price = last_fill.c.price
+        query = select(Position.asset_id, Position.quantity, fill_price.label('fill_price')) \
+            .select_from(Position) \
+            .outerjoin(last_fill, last_fill.c.asset_id == Position.asset_id)
+    else:
+        # Respaldo para SQLite sin funciones de ventana: subconsulta correlacionada
+        fill_price = select(Operation.price).where(
+            Operation.account_id == account_id,
+            Operation.asset_id == Position.asset_id
+        ).order_by(Operation.timestamp.desc(), Operation.id.desc()).limit(1).scalar_subquery()
+        query = select(Position.asset_id, Position.quantity, fill_price.label('fill_price')).select_from(Position)
+
+    if market_data_model is not None:
+        MarketData = market_data_model
+        held_assets = select(Position.asset_id).where(Position.account_id == account_id)
+        last_close = _latest_rows(
+            dialect,
+            [MarketData.activo_id, MarketData.cierre],
+            MarketData.activo_id,
+            [MarketData.fecha],
+            MarketData.activo_id.in_(held_assets)
+        )
+        if last_close is not None:
+            query = query.add_columns(last_close.c.cierre.label('market_price')) \
+                .outerjoin(last_close, last_close.c.activo_id == Position.asset_id)
+        else:
+            market_price = select(MarketData.cierre).where(MarketData.activo_id == Position.asset_id) \
+                .order_by(MarketData.fecha.desc()).limit(1).scalar_subquery()
+            query = query.add_columns(market_price.label('market_price'))
+
+    return query.where(Position.account_id == account_id)
+
+
+def positions_value(db, account_id, position_model, operation_model, market_data_model=None):
+    """
+    Valorar las posiciones de una cuenta con una sola consulta
+
+    Retorna:
+    - (valor total de las posiciones, lista de {'asset_id', 'quantity', 'price'})
+    """
+    dialect = db.get_bind().dialect
+    query = position_prices_query(dialect, account_id, position_model, operation_model, market_data_model)
+    total = Decimal(0)
+    valued = []
+    for row in db.execute(query):
+        price = row.fill_price
+        if market_data_model is not None and row.market_price is not None:
+            price = row.market_price
+        if price is None:
+            continue
+        total += Decimal(row.quantity) * Decimal(price)
+        valued.append({'asset_id': row.asset_id, 'quantity': row.quantity, 'price': price})
+    return total, valued
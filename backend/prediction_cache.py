@@ -0,0 +1,68 @@
+# prediction_cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Caché en memoria con caducidad por entrada y expulsión LRU
+
+    Se usa para servir predicciones repetidas de la misma barra y versión de modelo
+    sin consultar la base de datos ni ejecutar la inferencia.
+    """
+
+    def __init__(self, ttl_seconds=900, max_entries=1024):
+        """
+        Parámetros:
+        - ttl_seconds: Segundos que una entrada sigue siendo válida
+        - max_entries: Número máximo de entradas
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # {key: (expira_en, valor)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Valor de la clave, o None si no está o ha caducado"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# Caché compartida de predicciones por (símbolo, tipo de activo, modelo, barra, versión)
+prediction_cache = TTLCache(
+    ttl_seconds=int(os.getenv("PREDICTION_CACHE_TTL", 900)),
+    max_entries=int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 1024))
+)
@@ -6,52 +6,74 @@ from tensorflow.keras.models import Sequential, load_model
 from tensorflow.keras.layers import LSTM, Dense, Dropout
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 import xgboost as xgb
-import yfinance as yf
-import ccxt
 import joblib
 import os
+import json
+import time
+import threading
 from datetime import datetime, timedelta
 import logging
+from market_data_store import get_default_store, period_to_timedelta
+from numpy.lib.stride_tricks import sliding_window_view
+from windowing import sliding_windows, window_dataset
+from feature_engine import batch_features, feature_matrix, get_feature_engine
+from single_flight import SingleFlight
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 class TradingPredictor:
-    def __init__(self, model_type='lstm'):
+    def __init__(self, model_type='lstm', data_store=None, n_jobs=-1, model_dir="models"):
         self.model_type = model_type
+        self.n_jobs = n_jobs  # Hilos para Random Forest / XGBoost
+        self.data_store = data_store or get_default_store()
         self.model = None
+        self.loaded_key = None  # (symbol, asset_type) del modelo cargado en memoria
+        self._infer = None  # Función de inferencia compilada del LSTM
+        self.model_version = None  # Fecha del entrenamiento del modelo cargado (AAAAMMDDHHMMSS)
+        self.last_bar = None  # Última barra usada en el entrenamiento del modelo cargado
+        self.training_report = None  # Resumen del último entrenamiento (modo, épocas, muestras, tiempo, pérdida)
         self.scaler = MinMaxScaler(feature_range=(0, 1))
         self.look_back = 60  # Ventana de tiempo para las secuencias
-        self.model_dir = "models"
+        self.model_dir = model_dir
         
         # Crear directorio para modelos si no existe
         os.makedirs(self.model_dir, exist_ok=True)
         
+    def _fetch_shared(self, key, fetch):
+        """Ejecutar una lectura de datos compartiéndola con las llamadas concurrentes de la misma clave"""
+        data, coalesced = data_flight.do((id(self.data_store),) + key, fetch)
+        # Cada llamada recibe su propia copia del DataFrame compartido
+        return data.copy() if coalesced else data
+    
     def fetch_stock_data(self, symbol, period='1y', interval='1d'):
-        """Obtener datos de acciones usando yfinance"""
-        try:
-            data = yf.download(symbol, period=period, interval=interval)
+        """Obtener datos de acciones (almacén local + descarga incremental con yfinance)"""
+        def fetch():
+            start = datetime.now() - period_to_timedelta(period)
+            data = self.data_store.get(symbol, 'stock', start=start, interval=interval)
             if len(data) == 0:
                 raise ValueError(f"No se encontraron datos para {symbol}")
             return data
+        
+        try:
+            return self._fetch_shared((symbol, 'stock', period, interval), fetch)
         except Exception as e:
             logging.error(f"Error al obtener datos de {symbol}: {e}")
             raise
     
     def fetch_crypto_data(self, symbol, days=365):
-        """Obtener datos de criptomonedas usando ccxt"""
-        try:
-            exchange = ccxt.binance()
-            since = exchange.parse8601((datetime.now() - timedelta(days=days)).isoformat())
-            ohlcv = exchange.fetch_ohlcv(symbol, '1d', since=since)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        """Obtener datos de criptomonedas (almacén local + descarga incremental con ccxt)"""
+        def fetch():
+            start = datetime.now() - timedelta(days=days)
+            df = self.data_store.get(symbol, 'crypto', start=start, interval='1d').reset_index()
             if len(df) == 0:
                 raise ValueError(f"No se encontraron datos para {symbol}")
             return df
+        
+        try:
+            return self._fetch_shared((symbol, 'crypto', days), fetch)
         except Exception as e:
             logging.error(f"Error al obtener datos de {symbol}: {e}")
             raise
@@ -67,50 +89,15 @@ class TradingPredictor:
         # Normalizar datos
         scaled_data = self.scaler.fit_transform(close_data)
         
-        # Crear secuencias para LSTM
-        X, y = [], []
-        for i in range(len(scaled_data) - look_back):
-            X.append(scaled_data[i:i+look_back, 0])
-            y.append(scaled_data[i+look_back, 0])
-        
-        return np.array(X), np.array(y)
+        # Crear secuencias para LSTM (vistas de solo lectura, sin copiar)
+        return sliding_windows(scaled_data, look_back)
     
     def preprocess_data_for_tree_models(self, data, look_back=None):
         """Preprocesar datos para modelos basados en árboles (Random Forest, XGBoost)"""
         if look_back is None:
             look_back = self.look_back
             
-        # Crear características a partir de los precios de cierre pasados
-        df = pd.DataFrame(data['close'].values, columns=['close'])
-        
-        # Añadir características de retardos (lags)
-        for i in range(1, look_back + 1):
-            df[f'lag_{i}'] = df['close'].shift(i)
-        
-        # Añadir características de media móvil
-        df['ma_5'] = df['close'].rolling(window=5).mean().shift(1)
-        df['ma_10'] = df['close'].rolling(window=10).mean().shift(1)
-        df['ma_20'] = df['close'].rolling(window=20).mean().shift(1)
-        
-        # Añadir características de volatilidad
-        df['volatility_5'] = df['close'].rolling(window=5).std().shift(1)
-        df['volatility_10'] = df['close'].rolling(window=10).std().shift(1)
-        
-        # Añadir características de RSI
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['rsi'] = 100 - (100 / (1 + rs)).shift(1)
-        
-        # Eliminar filas con NaN
-        df = df.dropna()
-        
-        # Separar características y objetivo
-        X = df.drop('close', axis=1).values
-        y = df['close'].values
-        
-        return X, y
+        return batch_features(data['close'].values, look_back)
     
     def build_lstm_model(self, input_shape):
         """Construir modelo LSTM"""
@@ -131,26 +118,51 @@ class TradingPredictor:
             n_estimators=100,
             max_depth=10,
             random_state=42,
-            n_jobs=-1
+            n_jobs=self.n_jobs
         )
         return model
     
-    def build_xgboost_model(self):
-        """Construir modelo XGBoost"""
+    def build_xgboost_model(self, early_stopping_rounds=None):
+        """Construir modelo XGBoost (con early_stopping_rounds, fit necesita un eval_set)"""
         model = xgb.XGBRegressor(
             n_estimators=100,
             max_depth=6,
             learning_rate=0.1,
             random_state=42,
-            n_jobs=-1
+            n_jobs=self.n_jobs,
+            early_stopping_rounds=early_stopping_rounds
         )
         return model
     
-    def train(self, symbol, asset_type='stock', look_back=60, epochs=25, batch_size=32):
-        """Entrenar el modelo"""
+    def train(self, symbol, asset_type='stock', look_back=60, epochs=25, batch_size=32, incremental=False):
+        """
+        Entrenar el modelo
+        
+        Con incremental=True un LSTM ya guardado se ajusta solo con las barras nuevas
+        (ver fit_incremental, hasta epochs épocas); si no hay modelo previo se entrena
+        desde cero. Si no hay barras nuevas no se guarda nada y se devuelve None.
+        
+        Las llamadas concurrentes para el mismo modelo (directorio, símbolo, tipo de activo
+        y de modelo) comparten un único entrenamiento: las que esperan cargan después el
+        modelo guardado por la primera.
+        """
+        key = (os.path.abspath(self.model_dir), symbol, asset_type, self.model_type)
+        loss, coalesced = training_flight.do(
+            key, lambda: self._train(symbol, asset_type, look_back, epochs, batch_size, incremental)
+        )
+        if coalesced:
+            logging.info(f"Entrenamiento de {symbol} ({asset_type}, {self.model_type}) compartido con otra petición")
+            if not self.load_model(symbol, asset_type):
+                raise RuntimeError(f"No se pudo cargar el modelo recién entrenado de {symbol}")
+        return loss
+    
+    def _train(self, symbol, asset_type, look_back, epochs, batch_size, incremental=False):
         try:
-            logging.info(f"Entrenando modelo {self.model_type} para {symbol} ({asset_type})")
-            self.look_back = look_back
+            # Partir del modelo guardado solo si se conoce hasta qué barra se entrenó
+            warm_start = (incremental and self.model_type == 'lstm'
+                          and self.load_model(symbol, asset_type) and self.last_bar is not None)
+            logging.info(f"Entrenando modelo {self.model_type} para {symbol} ({asset_type})"
+                         f"{' de forma incremental' if warm_start else ''}")
             
             # Obtener datos según el tipo de activo
             if asset_type == 'stock':
@@ -158,85 +170,287 @@ class TradingPredictor:
             else:  # crypto
                 data = self.fetch_crypto_data(symbol)
             
-            # Preprocesar datos según el tipo de modelo
-            if self.model_type == 'lstm':
-                X, y = self.preprocess_data(data, look_back)
-                
-                # Dividir en entrenamiento y prueba
-                X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-                
-                # Reshape para LSTM [samples, time steps, features]
-                X_train = np.reshape(X_train, (X_train.shape[0], X_train.shape[1], 1))
-                X_test = np.reshape(X_test, (X_test.shape[0], X_test.shape[1], 1))
-                
-                # Construir y entrenar el modelo
-                self.model = self.build_lstm_model((look_back, 1))
-                self.model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, validation_data=(X_test, y_test))
-                
-                # Evaluar el modelo
-                loss = self.model.evaluate(X_test, y_test)
-                logging.info(f"Pérdida del modelo LSTM: {loss}")
-                
-            elif self.model_type in ['random_forest', 'xgboost']:
-                X, y = self.preprocess_data_for_tree_models(data, look_back)
-                
-                # Dividir en entrenamiento y prueba
-                X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-                
-                # Construir y entrenar el modelo
-                if self.model_type == 'random_forest':
-                    self.model = self.build_random_forest_model()
-                else:  # xgboost
-                    self.model = self.build_xgboost_model()
-                
-                self.model.fit(X_train, y_train)
-                
-                # Evaluar el modelo
-                y_pred = self.model.predict(X_test)
-                loss = mean_squared_error(y_test, y_pred)
-                logging.info(f"Pérdida del modelo {self.model_type}: {loss}")
-            
-            # Guardar el modelo y el scaler
-            model_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}.pkl")
-            scaler_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}_scaler.pkl")
-            
-            joblib.dump(self.model, model_filename)
-            joblib.dump(self.scaler, scaler_filename)
-            
-            # Guardar timestamp del entrenamiento
-            timestamp_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}_timestamp.txt")
-            with open(timestamp_filename, 'w') as f:
-                f.write(str(datetime.now().timestamp()))
-            
-            logging.info(f"Modelo guardado en {model_filename}")
+            if warm_start:
+                loss = self.fit_incremental(data, epochs=epochs, batch_size=batch_size)
+                if loss is None:
+                    # Sin barras nuevas: se conserva el modelo guardado tal cual (misma versión y fecha)
+                    return None
+            else:
+                loss = self.fit(data, look_back, epochs, batch_size)
+            self.last_bar = last_bar_timestamp(data)
+            self.save_model(symbol, asset_type)
             return loss
             
         except Exception as e:
             logging.error(f"Error durante el entrenamiento: {e}")
             raise
     
+    def fit(self, data, look_back=60, epochs=25, batch_size=32, callbacks_config=None):
+        """
+        Entrenar el modelo sobre datos ya cargados en memoria (sin descargar ni guardar nada)
+        
+        La validación es siempre la cola más reciente de la serie (chronological_split) y
+        el scaler del LSTM se ajusta solo con la parte de entrenamiento, así que la pérdida
+        devuelta es un error fuera de muestra honesto. Las características de los árboles
+        solo usan cierres anteriores a cada barra, sin estadísticas globales. El LSTM se
+        detiene cuando deja de mejorar en validación (ver lstm_callbacks) y XGBoost usa
+        early_stopping_rounds sobre la misma cola.
+        
+        Parámetros:
+        - callbacks_config: Cambios sobre TRAINING_CALLBACKS_CONFIG (paciencia, factor de la tasa, ...)
+        """
+        self.look_back = look_back
+        config = {**TRAINING_CALLBACKS_CONFIG, **(callbacks_config or {})}
+        start_time = time.perf_counter()
+        
+        # Preprocesar datos según el tipo de modelo
+        if self.model_type == 'lstm':
+            closes = data['close'].values.reshape(-1, 1)
+            
+            # Dividir en entrenamiento y validación sin barajar (la validación es el final de la serie)
+            split = chronological_split_point(max(len(closes) - look_back, 0), config['validation_fraction'])
+            
+            # Normalizar con los límites de las barras de entrenamiento (ventanas y objetivos
+            # anteriores a split), para que la cola de validación no influya en el escalado;
+            # las ventanas se generan por lotes con tf.data (memoria O(n))
+            self.scaler.fit(closes[:split + look_back])
+            scaled = self.scaler.transform(closes)[:, 0]
+            train_dataset, n_train = window_dataset(scaled, look_back, batch_size, stop=split, shuffle=True)
+            test_dataset, n_test = window_dataset(scaled, look_back, batch_size, start=split)
+            
+            # Construir y entrenar el modelo
+            self.model = self.build_lstm_model((look_back, 1))
+            history = self.model.fit(train_dataset, epochs=epochs, validation_data=test_dataset,
+                                     callbacks=lstm_callbacks(config))
+            epochs_run = len(history.history['loss'])
+            
+            # Evaluar el modelo
+            loss = self.model.evaluate(test_dataset)
+            logging.info(f"Pérdida del modelo LSTM: {loss} ({epochs_run} de {epochs} épocas)")
+            self._build_inference_function()
+            
+        elif self.model_type in ['random_forest', 'xgboost']:
+            X, y = self.preprocess_data_for_tree_models(data, look_back)
+            
+            # Dividir en entrenamiento y validación sin barajar (la validación es el final de la serie)
+            X_train, X_test, y_train, y_test = chronological_split(X, y, config['validation_fraction'])
+            
+            # Construir y entrenar el modelo
+            if self.model_type == 'random_forest':
+                self.model = self.build_random_forest_model()
+                self.model.fit(X_train, y_train)
+                epochs_run = None
+            else:  # xgboost
+                self.model = self.build_xgboost_model(early_stopping_rounds=config['xgboost_early_stopping_rounds'])
+                self.model.fit(X_train, y_train, eval_set=[(X_test, y_test)], verbose=False)
+                epochs_run = self.model.best_iteration + 1
+            
+            n_train, n_test = len(X_train), len(X_test)
+            
+            # Evaluar el modelo
+            y_pred = self.model.predict(X_test)
+            loss = mean_squared_error(y_test, y_pred)
+            logging.info(f"Pérdida del modelo {self.model_type}: {loss}")
+            
+            if config['refit_full']:
+                # Los árboles no extrapolan: volver a entrenar incluyendo la cola más reciente
+                # (XGBoost con el número de árboles elegido por la parada temprana)
+                if self.model_type == 'random_forest':
+                    self.model = self.build_random_forest_model()
+                else:
+                    self.model = self.build_xgboost_model()
+                    self.model.set_params(n_estimators=epochs_run)
+                self.model.fit(X, y)
+        
+        else:
+            raise ValueError(f"Tipo de modelo no soportado: {self.model_type}")
+        
+        self.training_report = {
+            'mode': 'full',
+            'epochs_run': epochs_run,  # Épocas del LSTM o árboles de XGBoost usados
+            'train_samples': n_train,
+            'validation_samples': n_test,
+            'seconds': time.perf_counter() - start_time,
+            'loss': float(loss),
+        }
+        self.loaded_key = None
+        self.model_version = None
+        return loss
+    
+    def fit_incremental(self, data, epochs=10, batch_size=32, patience=3, learning_rate=1e-4,
+                        validation_fraction=0.2):
+        """
+        Ajustar el LSTM cargado con las barras posteriores a self.last_bar
+        
+        Se conservan los pesos y el scaler del modelo anterior y solo se entrena con las
+        ventanas que terminan en barras nuevas, con una tasa de aprendizaje baja y parada
+        temprana sobre las últimas ventanas (validación en orden temporal).
+        
+        Retorna:
+        - Pérdida de validación (o de entrenamiento si hay muy pocas barras nuevas),
+          o None si no hay barras nuevas
+        """
+        if self.model_type != 'lstm' or self.model is None or self.last_bar is None:
+            raise ValueError("El ajuste incremental necesita un LSTM cargado con su última barra")
+        start_time = time.perf_counter()
+        look_back = self.look_back
+        
+        timestamps = pd.to_datetime(data['timestamp'].values if 'timestamp' in data.columns else data.index)
+        closes = data['close'].values
+        start = max(int(np.searchsorted(timestamps, pd.Timestamp(self.last_bar), side='right')), look_back)
+        if start >= len(closes):
+            logging.info("Sin barras nuevas desde el último entrenamiento")
+            return None
+        
+        # Ventanas con su contexto previo cuyo objetivo es cada barra nueva
+        scaled = self.scaler.transform(closes[start - look_back:].reshape(-1, 1))
+        X, y = sliding_windows(scaled, look_back)
+        X = X[..., np.newaxis]
+        X_train, X_val, y_train, y_val = chronological_split(X, y, validation_fraction)
+        
+        self.model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate), loss='mean_squared_error')
+        history = self.model.fit(
+            X_train, y_train, epochs=epochs, batch_size=batch_size, verbose=0,
+            validation_data=(X_val, y_val) if len(X_val) else None,
+            callbacks=lstm_callbacks({'patience': patience, 'reduce_lr': False,
+                                      'monitor': 'val_loss' if len(X_val) else 'loss'})
+        )
+        loss = float(self.model.evaluate(X_val, y_val, verbose=0) if len(X_val) else min(history.history['loss']))
+        logging.info(f"Pérdida del ajuste incremental del LSTM: {loss} ({len(y)} barras nuevas)")
+        self._build_inference_function()
+        
+        self.training_report = {
+            'mode': 'incremental',
+            'epochs_run': len(history.history['loss']),
+            'train_samples': len(X_train),
+            'validation_samples': len(X_val),
+            'seconds': time.perf_counter() - start_time,
+            'loss': loss,
+        }
+        self.loaded_key = None
+        self.model_version = None
+        return loss
+    
+    def save_model(self, symbol, asset_type):
+        """
+        Guardar el modelo, el scaler y el timestamp del entrenamiento en model_dir
+        
+        Cada fichero se escribe en un temporal y se renombra, así que un lector nunca ve
+        un fichero a medio escribir. El timestamp se escribe el último: el registro de
+        modelos lo usa para detectar que hay una versión nueva.
+        """
+        model_filename = self.get_model_filename(symbol, asset_type)
+        scaler_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}_scaler.pkl")
+        
+        if self.model_type == 'lstm':
+            # Formato nativo de Keras en lugar de pickle
+            atomic_write(model_filename, self.model.save)
+            legacy_filename = self.get_model_filename(symbol, asset_type, legacy=True)
+            if os.path.exists(legacy_filename):
+                os.remove(legacy_filename)
+        else:
+            atomic_write(model_filename, lambda path: joblib.dump(self.model, path))
+        atomic_write(scaler_filename, lambda path: joblib.dump(self.scaler, path))
+        
+        # Última barra usada, necesaria para el ajuste incremental
+        meta = {'last_bar': pd.Timestamp(self.last_bar).isoformat() if self.last_bar is not None else None,
+                'look_back': self.look_back}
+        
+        def write_meta(path):
+            with open(path, 'w') as f:
+                json.dump(meta, f)
+        
+        atomic_write(self.get_meta_filename(symbol, asset_type), write_meta)
+        self.loaded_key = (symbol, asset_type)
+        
+        # Guardar timestamp del entrenamiento
+        timestamp = datetime.now().timestamp()
+        timestamp_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}_timestamp.txt")
+        
+        def write_timestamp(path):
+            with open(path, 'w') as f:
+                f.write(str(timestamp))
+        
+        atomic_write(timestamp_filename, write_timestamp)
+        self.model_version = format_model_version(timestamp)
+        
+        logging.info(f"Modelo guardado en {model_filename}")
+    
+    def get_meta_filename(self, symbol, asset_type):
+        return os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}_meta.json")
+    
+    def get_model_filename(self, symbol, asset_type, legacy=False):
+        """Ruta del fichero del modelo (.keras para LSTM, .pkl para el resto o para modelos antiguos)"""
+        extension = '.keras' if self.model_type == 'lstm' and not legacy else '.pkl'
+        return os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}{extension}")
+    
+    def _build_inference_function(self):
+        """Compilar una única vez la función de inferencia del LSTM (evita la sobrecarga de model.predict)"""
+        model = self.model
+        self.look_back = model.input_shape[1]
+        self._infer = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec(shape=(None, self.look_back, 1), dtype=tf.float32)]
+        )
+    
+    def predict_scaled(self, X):
+        """Ejecutar el modelo LSTM sobre ventanas ya escaladas de forma (n, look_back, 1)"""
+        if getattr(self, '_infer', None) is None:
+            self._build_inference_function()
+        return self._infer(tf.convert_to_tensor(X, dtype=tf.float32)).numpy()
+    
     def load_model(self, symbol, asset_type):
         """Cargar modelo entrenado"""
-        model_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}.pkl")
+        model_filename = self.get_model_filename(symbol, asset_type)
         scaler_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}_scaler.pkl")
         
+        if self.model_type == 'lstm' and not os.path.exists(model_filename):
+            # Compatibilidad con modelos LSTM guardados con joblib
+            model_filename = self.get_model_filename(symbol, asset_type, legacy=True)
+        
         if os.path.exists(model_filename) and os.path.exists(scaler_filename):
-            self.model = joblib.load(model_filename)
+            if model_filename.endswith('.keras'):
+                # Solo inferencia: no hace falta restaurar el optimizador
+                self.model = load_model(model_filename, compile=False)
+            else:
+                self.model = joblib.load(model_filename)
             self.scaler = joblib.load(scaler_filename)
+            timestamp = self.read_model_timestamp(symbol, asset_type)
+            self.model_version = format_model_version(timestamp) if timestamp is not None else None
+            self.last_bar = self.read_last_bar(symbol, asset_type)
+            self._infer = None
+            if self.model_type == 'lstm':
+                self._build_inference_function()
+            self.loaded_key = (symbol, asset_type)
             return True
         return False
     
     def model_exists(self, symbol, asset_type):
         """Verificar si el modelo ya existe"""
-        model_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}.pkl")
-        return os.path.exists(model_filename)
+        return (os.path.exists(self.get_model_filename(symbol, asset_type))
+                or os.path.exists(self.get_model_filename(symbol, asset_type, legacy=True)))
     
-    def get_model_age(self, symbol, asset_type):
-        """Obtener la antigüedad del modelo en días"""
+    def read_model_timestamp(self, symbol, asset_type):
+        """Momento del último entrenamiento guardado (segundos desde epoch), o None"""
         timestamp_filename = os.path.join(self.model_dir, f"{symbol}_{asset_type}_{self.model_type}_timestamp.txt")
         if os.path.exists(timestamp_filename):
             with open(timestamp_filename, 'r') as f:
-                timestamp = float(f.read())
+                return float(f.read())
+        return None
+    
+    def read_last_bar(self, symbol, asset_type):
+        """Última barra usada en el entrenamiento guardado, o None (modelos anteriores a este dato)"""
+        meta_filename = self.get_meta_filename(symbol, asset_type)
+        if os.path.exists(meta_filename):
+            with open(meta_filename, 'r') as f:
+                last_bar = json.load(f).get('last_bar')
+            return pd.Timestamp(last_bar) if last_bar else None
+        return None
+    
+    def get_model_age(self, symbol, asset_type):
+        """Obtener la antigüedad del modelo en días"""
+        timestamp = self.read_model_timestamp(symbol, asset_type)
+        if timestamp is not None:
             now = datetime.now().timestamp()
             age_days = (now - timestamp) / (24 * 3600)
             return age_days
@@ -253,102 +467,306 @@ class TradingPredictor:
         
         return False
     
-    def predict(self, symbol, asset_type='stock', days_ahead=1, force_retrain=False):
-        """Realizar predicción, entrenando el modelo si es necesario"""
-        try:
-            # Verificar si el modelo existe y si debe ser reentrenado
-            if force_retrain or self.should_retrain(symbol, asset_type):
-                logging.info(f"Modelo necesita entrenamiento. Entrenando modelo {self.model_type} para {symbol} ({asset_type})...")
+    def ensure_model(self, symbol, asset_type, force_retrain=False, retrain_stale=False):
+        """
+        Cargar el modelo del símbolo, entrenándolo si no existe
+        
+        Un modelo desactualizado se sigue sirviendo (lo reentrena RetrainScheduler en
+        segundo plano) salvo que se pida retrain_stale o force_retrain.
+        """
+        if not self.model_exists(symbol, asset_type):
+            logging.info(f"Modelo inexistente. Entrenando modelo {self.model_type} para {symbol} ({asset_type})...")
+            self.train(symbol, asset_type)
+        elif force_retrain or (retrain_stale and self.should_retrain(symbol, asset_type)):
+            logging.info(f"Modelo necesita entrenamiento. Entrenando modelo {self.model_type} para {symbol} ({asset_type})...")
+            self.train(symbol, asset_type)
+        elif self.loaded_key != (symbol, asset_type):
+            # Cargar el modelo existente (si no está ya en memoria)
+            if not self.load_model(symbol, asset_type):
+                logging.info(f"No se pudo cargar el modelo, entrenando uno nuevo...")
                 self.train(symbol, asset_type)
-            else:
-                # Cargar el modelo existente
-                if not self.load_model(symbol, asset_type):
-                    logging.info(f"No se pudo cargar el modelo, entrenando uno nuevo...")
-                    self.train(symbol, asset_type)
+    
+    def fetch_recent_data(self, symbol, asset_type):
+        """Obtener los datos recientes usados para predecir"""
+        # Suficientes días naturales para look_back barras más el calentamiento de las medias y el RSI
+        # (los mercados de acciones tienen ~252 sesiones al año)
+        days = max(60, int((self.look_back + 21) * 1.5))
+        if asset_type == 'stock':
+            return self.fetch_stock_data(symbol, period=f'{days}d')
+        return self.fetch_crypto_data(symbol, days=days)
+    
+    def prepare_input(self, symbol, asset_type, data):
+        """Construir la entrada del modelo para la última barra: ventana escalada (LSTM) o fila de características"""
+        if self.model_type == 'lstm':
+            # Preprocesar datos
+            recent_data = data['close'].values[-self.look_back:].reshape(-1, 1)
+            scaled_data = self.scaler.transform(recent_data)
+            
+            # Reshape para predicción
+            return np.reshape(scaled_data, (1, self.look_back, 1))
+        
+        # Actualizar el motor incremental con las barras nuevas y tomar la última fila
+        engine = get_feature_engine(symbol, asset_type, self.look_back)
+        timestamps = data['timestamp'].values if 'timestamp' in data.columns else data.index.values
+        latest_row = engine.extend(data['close'].values, timestamps)
+        if latest_row is None:
+            raise ValueError(f"Datos insuficientes para calcular características de {symbol}")
+        return latest_row.reshape(1, -1)
+    
+    def build_prediction_result(self, symbol, predicted_price, last_price, days_ahead=1, bar_timestamp=None):
+        """Construir el diccionario de predicción a partir del precio previsto"""
+        predicted_price = float(np.ravel(predicted_price)[0])
+        
+        # Determinar tendencia y recomendación
+        change_percent = ((predicted_price - last_price) / last_price) * 100
+        trend, recommendation = classify_change(change_percent)
+        
+        # Calcular confianza (simplificado)
+        confidence = min(abs(change_percent) / 5, 0.99)
+        
+        return {
+            "symbol": symbol,
+            "current_price": float(last_price),
+            "predicted_price": predicted_price,
+            "change_percent": float(change_percent),
+            "trend": trend,
+            "recommendation": recommendation,
+            "confidence": float(confidence),
+            "prediction_date": datetime.now().isoformat(),
+            "target_date": (datetime.now() + timedelta(days=days_ahead)).isoformat(),
+            "model": self.model_type,
+            "model_version": self.model_version,
+            "bar_timestamp": pd.Timestamp(bar_timestamp).isoformat() if bar_timestamp is not None else None
+        }
+    
+    def predict(self, symbol, asset_type='stock', days_ahead=1, force_retrain=False, retrain_stale=False):
+        """Realizar predicción, entrenando el modelo solo si no existe o si se pide (ver ensure_model)"""
+        try:
+            self.ensure_model(symbol, asset_type, force_retrain, retrain_stale)
             
             # Obtener datos recientes
-            if asset_type == 'stock':
-                data = self.fetch_stock_data(symbol, period='60d')
-            else:  # crypto
-                data = self.fetch_crypto_data(symbol, days=60)
+            data = self.fetch_recent_data(symbol, asset_type)
+            X_pred = self.prepare_input(symbol, asset_type, data)
             
             # Realizar predicción según el tipo de modelo
             if self.model_type == 'lstm':
-                # Preprocesar datos
-                recent_data = data['close'].values[-self.look_back:].reshape(-1, 1)
-                scaled_data = self.scaler.transform(recent_data)
-                
-                # Reshape para predicción
-                X_pred = np.reshape(scaled_data, (1, self.look_back, 1))
-                
-                # Realizar predicción
-                predicted_price = self.model.predict(X_pred)
-                predicted_price = self.scaler.inverse_transform(predicted_price)
-                
+                predicted_price = self.scaler.inverse_transform(self.predict_scaled(X_pred))
             elif self.model_type in ['random_forest', 'xgboost']:
-                # Preprocesar datos para modelos de árbol
-                X, _ = self.preprocess_data_for_tree_models(data, self.look_back)
-                
-                # Tomar la última fila para la predicción
-                X_pred = X[-1:].reshape(1, -1)
-                
-                # Realizar predicción
                 predicted_price = self.model.predict(X_pred)
             
             # Obtener último precio real
             last_price = data['close'].values[-1]
             
-            # Determinar tendencia y recomendación
-            change_percent = ((predicted_price[0] - last_price) / last_price) * 100
-            
-            if change_percent > 2:
-                trend = "subira"
-                recommendation = "comprar"
-            elif change_percent < -2:
-                trend = "bajara"
-                recommendation = "vender"
-            else:
-                trend = "mantendra"
-                recommendation = "mantener"
-            
-            # Calcular confianza (simplificado)
-            confidence = min(abs(change_percent) / 5, 0.99)
-            
-            result = {
-                "symbol": symbol,
-                "current_price": float(last_price),
-                "predicted_price": float(predicted_price[0]),
-                "change_percent": float(change_percent),
-                "trend": trend,
-                "recommendation": recommendation,
-                "confidence": float(confidence),
-                "prediction_date": datetime.now().isoformat(),
-                "target_date": (datetime.now() + timedelta(days=days_ahead)).isoformat(),
-                "model": self.model_type
-            }
-            
+            result = self.build_prediction_result(symbol, predicted_price, last_price, days_ahead,
+                                                  bar_timestamp=last_bar_timestamp(data))
             logging.info(f"Predicción generada: {result}")
             return result
             
         except Exception as e:
             logging.error(f"Error durante la predicción: {e}")
             raise
-
-
-# Función para entrenar modelos para múltiples activos
-def train_models_for_assets(assets, model_types=['lstm', 'random_forest', 'xgboost']):
-    """Entrenar modelos para una lista de activos"""
-    for asset in assets:
-        symbol = asset['symbol']
-        asset_type = asset['type']
+    
+    def predict_history(self, closes, indices):
+        """
+        Predecir en una sola llamada el precio siguiente de varias barras de una serie histórica
+        
+        Cada predicción usa solo el historial hasta su barra (incluida), igual que predict()
+        con los datos disponibles en ese momento.
         
-        for model_type in model_types:
+        Parámetros:
+        - closes: Array con los precios de cierre
+        - indices: Posiciones de las barras a predecir
+        
+        Retorna:
+        - Array de precios previstos (NaN en las barras sin historial suficiente)
+        """
+        closes = np.asarray(closes, dtype=float)
+        indices = np.asarray(indices, dtype=int)
+        predicted = np.full(len(indices), np.nan)
+        if len(indices) == 0:
+            return predicted
+        
+        if self.model_type == 'lstm':
+            valid = indices >= self.look_back - 1
+            if valid.any():
+                scaled = self.scaler.transform(closes[:indices[valid].max() + 1].reshape(-1, 1))[:, 0]
+                windows = sliding_window_view(scaled, self.look_back)[indices[valid] - self.look_back + 1]
+                output = self.predict_scaled(windows[..., np.newaxis])
+                predicted[valid] = self.scaler.inverse_transform(output)[:, 0]
+        else:
+            X = feature_matrix(closes[:indices.max() + 1], self.look_back)[indices]
+            valid = ~np.isnan(X).any(axis=1)
+            if valid.any():
+                predicted[valid] = self.model.predict(X[valid])
+        
+        return predicted
+    
+    def predict_many(self, symbols, asset_type='stock', days_ahead=1, loader=None):
+        """
+        Realizar predicciones para varios símbolos
+        
+        Los símbolos que comparten instancia de modelo se agrupan y sus entradas se apilan
+        en una sola llamada; como cada símbolo suele tener su propio modelo, en la práctica
+        hay una llamada por símbolo. Los LSTM usan la función compilada de su predictor
+        (predict_scaled, sin la sobrecarga de model.predict), que se traza una vez por
+        modelo y se libera con él cuando el registro lo expulsa.
+        
+        Parámetros:
+        - symbols: Lista de símbolos
+        - asset_type: 'stock' o 'crypto'
+        - days_ahead: Horizonte de la predicción en días
+        - loader: Función (symbol, asset_type) -> TradingPredictor con el modelo cargado
+                  (por defecto se carga o entrena un predictor nuevo por símbolo)
+        
+        Retorna:
+        - Lista con un diccionario por símbolo (mismo formato que predict, o {'symbol', 'error'})
+        """
+        if loader is None:
+            def loader(symbol, asset_type):
+                predictor = TradingPredictor(model_type=self.model_type, data_store=self.data_store)
+                predictor.ensure_model(symbol, asset_type)
+                return predictor
+        
+        results = {}
+        groups = {}  # {id del modelo: [(symbol, predictor, X, data)]}
+        for symbol in symbols:
             try:
-                predictor = TradingPredictor(model_type=model_type)
-                predictor.train(symbol, asset_type)
-                logging.info(f"Modelo {model_type} entrenado para {symbol}")
+                predictor = loader(symbol, asset_type)
+                data = predictor.fetch_recent_data(symbol, asset_type)
+                X = predictor.prepare_input(symbol, asset_type, data)
+                groups.setdefault(id(predictor.model), []).append((symbol, predictor, X, data))
             except Exception as e:
-                logging.error(f"Error al entrenar modelo {model_type} para {symbol}: {e}")
+                logging.error(f"Error al preparar la predicción de {symbol}: {e}")
+                results[symbol] = {"symbol": symbol, "error": str(e)}
+        
+        for members in groups.values():
+            stacked = np.concatenate([X for _, _, X, _ in members])
+            owner = members[0][1]
+            try:
+                if self.model_type == 'lstm':
+                    predicted = owner.scaler.inverse_transform(owner.predict_scaled(stacked))
+                    outputs = [predicted[i:i + 1] for i in range(len(members))]
+                else:
+                    outputs = owner.model.predict(stacked)
+                for (symbol, predictor, _, data), predicted_price in zip(members, outputs):
+                    results[symbol] = predictor.build_prediction_result(symbol, predicted_price, data['close'].values[-1],
+                                                                        days_ahead, bar_timestamp=last_bar_timestamp(data))
+            except Exception as e:
+                logging.error(f"Error durante la predicción por lotes: {e}")
+                for symbol, _, _, _ in members:
+                    results[symbol] = {"symbol": symbol, "error": str(e)}
+        
+        return [results[symbol] for symbol in symbols]
+
+
+# Parada temprana y reducción de la tasa de aprendizaje al entrenar
+TRAINING_CALLBACKS_CONFIG = {
+    'validation_fraction': 0.2,  # Cola de la serie usada como validación
+    'monitor': 'val_loss',
+    'patience': 5,  # Épocas sin mejora antes de parar (restaurando los mejores pesos)
+    'min_delta': 1e-6,
+    'reduce_lr': True,
+    'lr_factor': 0.5,  # Factor de la tasa de aprendizaje tras lr_patience épocas sin mejora
+    'lr_patience': 2,
+    'min_lr': 1e-5,
+    'xgboost_early_stopping_rounds': 10,
+    'refit_full': True,  # Reentrenar los modelos de árbol con toda la serie tras validar
+}
+
+
+def lstm_callbacks(config=None):
+    """EarlyStopping (y ReduceLROnPlateau si config['reduce_lr']) para el entrenamiento del LSTM"""
+    config = {**TRAINING_CALLBACKS_CONFIG, **(config or {})}
+    callbacks = [tf.keras.callbacks.EarlyStopping(
+        monitor=config['monitor'], patience=config['patience'], min_delta=config['min_delta'],
+        restore_best_weights=True
+    )]
+    if config['reduce_lr']:
+        callbacks.append(tf.keras.callbacks.ReduceLROnPlateau(
+            monitor=config['monitor'], factor=config['lr_factor'], patience=config['lr_patience'],
+            min_lr=config['min_lr']
+        ))
+    return callbacks
+
+
+def chronological_split(X, y, validation_fraction=0.2):
+    """
+    Dividir muestras ordenadas en el tiempo sin barajar: la validación es la cola más reciente
+    
+    Retorna:
+    - X_train, X_val, y_train, y_val (validación vacía si hay menos de dos muestras)
+    """
+    split = chronological_split_point(len(X), validation_fraction)
+    return X[:split], X[split:], y[:split], y[split:]
+
+
+def chronological_split_point(n_samples, validation_fraction=0.2):
+    """Índice de la primera muestra de validación (al menos una si hay dos o más muestras)"""
+    n_val = int(n_samples * validation_fraction)
+    if n_samples >= 2:
+        n_val = max(n_val, 1)
+    return n_samples - n_val
+
+
+# Entrenamientos y lecturas de datos en curso, compartidos entre peticiones concurrentes
+training_flight = SingleFlight()
+data_flight = SingleFlight()
+
+
+def atomic_write(path, write):
+    """
+    Escribir un fichero de forma atómica: write(ruta_temporal) y después os.replace
+    
+    El temporal conserva la extensión (Keras la necesita para elegir el formato) y es
+    único por proceso e hilo, así que dos escrituras simultáneas no se pisan.
+    """
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.tmp-{os.getpid()}-{threading.get_ident()}{extension}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def format_model_version(timestamp):
+    """Versión de un modelo a partir del momento de su entrenamiento"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y%m%d%H%M%S')
+
+
+def last_bar_timestamp(data):
+    """Fecha de la última barra de un DataFrame de precios (índice o columna 'timestamp')"""
+    if 'timestamp' in data.columns:
+        return data['timestamp'].values[-1]
+    return data.index[-1]
+
+
+def classify_change(change_percent, threshold=2.0):
+    """Traducir la variación prevista (%) en (tendencia, recomendación)"""
+    if change_percent > threshold:
+        return "subira", "comprar"
+    if change_percent < -threshold:
+        return "bajara", "vender"
+    return "mantendra", "mantener"
+
+
+# Función para entrenar modelos para múltiples activos
+def train_models_for_assets(assets, model_types=['lstm', 'random_forest', 'xgboost'], max_workers=None, **train_kwargs):
+    """
+    Entrenar modelos para una lista de activos
+    
+    Con max_workers > 1 los trabajos se reparten en un pool de procesos (ver training_pool).
+    Retorna un informe por trabajo con estado, pérdida y duración.
+    """
+    if max_workers and max_workers > 1:
+        from training_pool import train_models_parallel
+        return train_models_parallel(assets, model_types, max_workers=max_workers, **train_kwargs)
+    
+    from training_pool import _train_job
+    return [_train_job(asset['symbol'], asset['type'], model_type, -1, train_kwargs)
+            for asset in assets for model_type in model_types]
 
 
 # Ejemplo de uso
@@ -0,0 +1,216 @@
+# retrain_scheduler.py
+import os
+import time
+import zlib
+import threading
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from prediction_model import TradingPredictor
+
+MODEL_TYPES = ('lstm', 'random_forest', 'xgboost')
+ASSET_TYPES = ('stock', 'crypto')
+TIMESTAMP_SUFFIX = '_timestamp.txt'
+
+
+def scan_models(model_dir="models"):
+    """
+    Modelos entrenados en model_dir a partir de sus ficheros de timestamp
+
+    Retorna:
+    - Lista de ((símbolo, tipo de activo, tipo de modelo), momento del entrenamiento en segundos)
+    """
+    models = []
+    if not os.path.isdir(model_dir):
+        return models
+    for filename in os.listdir(model_dir):
+        if not filename.endswith(TIMESTAMP_SUFFIX):
+            continue
+        stem = filename[:-len(TIMESTAMP_SUFFIX)]
+        for asset_type in ASSET_TYPES:
+            for model_type in MODEL_TYPES:
+                suffix = f"_{asset_type}_{model_type}"
+                if stem.endswith(suffix) and len(stem) > len(suffix):
+                    try:
+                        with open(os.path.join(model_dir, filename), 'r') as f:
+                            trained_at = float(f.read())
+                    except (OSError, ValueError):
+                        continue
+                    models.append(((stem[:-len(suffix)], asset_type, model_type), trained_at))
+    return models
+
+
+class RetrainScheduler:
+    """
+    Reentrenamiento en segundo plano de los modelos que van a quedar desactualizados
+
+    Revisa periódicamente los modelos guardados en disco y reentrena, antes de que
+    caduquen (max_age_days, el mismo criterio que should_retrain), los que están a
+    menos de lead_hours de hacerlo. Cada modelo adelanta además su reentrenamiento un
+    desfase fijo dentro de stagger_hours, calculado a partir de su clave, para que los
+    modelos entrenados a la vez no caduquen todos juntos. Los entrenamientos se ejecutan
+    en un pool de max_workers hilos y el modelo nuevo sustituye al anterior en el
+    registro sin interrumpir las predicciones en curso.
+
+    Un reentrenamiento incremental sin barras nuevas no guarda nada (la fecha del modelo
+    no cambia); esa clave no se vuelve a intentar hasta pasadas recheck_hours.
+    """
+
+    def __init__(self, registry, model_dir="models", max_age_days=7, lead_hours=12, stagger_hours=24,
+                 max_workers=1, poll_seconds=900, train_kwargs=None, recheck_hours=24):
+        """
+        Parámetros:
+        - registry: ModelRegistry donde se publican los modelos reentrenados
+        - model_dir: Directorio donde TradingPredictor guarda los modelos
+        - max_age_days: Antigüedad a partir de la cual un modelo está desactualizado
+        - lead_hours: Horas de antelación con que se reentrena un modelo
+        - stagger_hours: Ventana en la que se reparten los reentrenamientos
+        - max_workers: Entrenamientos simultáneos
+        - poll_seconds: Segundos entre revisiones
+        - train_kwargs: Argumentos adicionales para TradingPredictor.train
+        - recheck_hours: Espera antes de reintentar un modelo que no tenía barras nuevas
+        """
+        self.registry = registry
+        self.model_dir = model_dir
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.lead_seconds = lead_hours * 3600
+        self.stagger_seconds = stagger_hours * 3600
+        self.max_workers = max_workers
+        self.poll_seconds = poll_seconds
+        self.train_kwargs = train_kwargs or {}
+        self.recheck_seconds = recheck_hours * 3600
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._running = set()  # Claves con un reentrenamiento en curso o en cola
+        self.scans = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.unchanged = 0
+        self.last_scan = None
+        self.checked_at = {}  # {clave: momento de la última comprobación sin barras nuevas}
+        self.last_errors = {}  # {clave: último error}
+
+    def stagger_offset(self, key):
+        """Segundos que se adelanta el reentrenamiento de un modelo (fijo para cada clave)"""
+        if self.stagger_seconds <= 0:
+            return 0
+        return zlib.crc32("|".join(key).encode()) % int(self.stagger_seconds)
+
+    def due_at(self, key, trained_at):
+        """Momento (segundos desde epoch) en que debe reentrenarse un modelo"""
+        return trained_at + self.max_age_seconds - self.lead_seconds - self.stagger_offset(key)
+
+    def due_models(self, now=None):
+        """Claves de los modelos que ya deben reentrenarse, de la más antigua a la más reciente"""
+        now = now if now is not None else time.time()
+        due = [(self.due_at(key, trained_at), key) for key, trained_at in scan_models(self.model_dir)]
+        with self._lock:
+            checked_at = dict(self.checked_at)
+        return [key for due_time, key in sorted(due)
+                if due_time <= now and now - checked_at.get(key, 0) >= self.recheck_seconds]
+
+    def run_once(self, now=None):
+        """
+        Revisar los modelos y encolar los reentrenamientos pendientes
+
+        Retorna:
+        - Lista de claves encoladas en esta revisión
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="retrain")
+        submitted = []
+        for key in self.due_models(now):
+            with self._lock:
+                if key in self._running:
+                    continue
+                self._running.add(key)
+                self.submitted += 1
+            future = self._executor.submit(self._retrain, key)
+            future.add_done_callback(lambda f, key=key: f.cancelled() and self._discard(key))
+            submitted.append(key)
+        with self._lock:
+            self.scans += 1
+            self.last_scan = datetime.now().isoformat()
+        if submitted:
+            logging.info(f"Reentrenamientos programados: {submitted}")
+        return submitted
+
+    def _discard(self, key):
+        with self._lock:
+            self._running.discard(key)
+
+    def _retrain(self, key):
+        symbol, asset_type, model_type = key
+        try:
+            predictor = TradingPredictor(model_type=model_type, model_dir=self.model_dir)
+            if predictor.train(symbol, asset_type, **self.train_kwargs) is None:
+                # Ajuste incremental sin barras nuevas: el modelo servido sigue siendo el mismo
+                with self._lock:
+                    self.unchanged += 1
+                    self.checked_at[key] = time.time()
+                logging.info(f"Sin barras nuevas para {model_type} de {symbol} ({asset_type}); "
+                             f"se revisará en {self.recheck_seconds / 3600:g} h")
+                return
+            # Sustituir el modelo servido por el nuevo
+            self.registry.put(symbol, asset_type, model_type, predictor)
+            with self._lock:
+                self.succeeded += 1
+                self.checked_at.pop(key, None)
+                self.last_errors.pop(key, None)
+            logging.info(f"Modelo {model_type} de {symbol} ({asset_type}) reentrenado en segundo plano")
+        except Exception as e:
+            logging.error(f"Error al reentrenar {model_type} de {symbol} ({asset_type}): {e}")
+            with self._lock:
+                self.failed += 1
+                self.last_errors[key] = str(e)
+        finally:
+            self._discard(key)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Error al revisar los modelos a reentrenar: {e}")
+            self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="retrain-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=False):
+        """Detener las revisiones (los entrenamientos en curso terminan salvo que el proceso acabe)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        now = time.time()
+        upcoming = sorted(
+            (self.due_at(key, trained_at), key) for key, trained_at in scan_models(self.model_dir)
+        )
+        with self._lock:
+            return {
+                "scans": self.scans,
+                "submitted": self.submitted,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "unchanged": self.unchanged,
+                "running": [list(key) for key in self._running],
+                "last_scan": self.last_scan,
+                "last_errors": {"|".join(key): error for key, error in self.last_errors.items()},
+                "models": [
+                    {"key": list(key), "due_in_hours": round((due_time - now) / 3600, 2)}
+                    for due_time, key in upcoming
+                ],
+            }
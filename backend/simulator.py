@@ -6,12 +6,31 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from . import models
 from .risk_management import RiskManager
+from .performance_metrics import compute_performance_metrics
+from .portfolio_valuation import positions_value
 import os
+from decimal import Decimal, InvalidOperation
+
+def _order_decimal(i, order, field):
+    """Valor numérico de una orden como Decimal (ValueError si falta, no es un número o no es finito)"""
+    try:
+        value = Decimal(str(order[field]))
+    except InvalidOperation:
+        raise ValueError(f"Orden {i}: {field} no es un número válido ({order[field]!r})")
+    if not value.is_finite():
+        raise ValueError(f"Orden {i}: {field} debe ser un número finito")
+    return value
 
 class TradingSimulator:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, on_fill=None):
+        """
+        Parámetros:
+        - db: Sesión de base de datos
+        - on_fill: Función opcional llamada con cada operación ejecutada (tras el commit)
+        """
         self.db = db
         self.risk_manager = RiskManager()
+        self.on_fill = on_fill
     
     def create_simulation_account(self, user_id: int, account_name: str, initial_balance: float):
         """Crear una nueva cuenta de simulación"""
@@ -112,6 +131,8 @@ class TradingSimulator:
             self.db.add(position)
         
         self.db.commit()
+        if self.on_fill is not None:
+            self.on_fill(operation)
         return operation
     
     def execute_sell_order(self, account_id: int, asset_id: int, quantity: float, price: float):
@@ -150,8 +171,112 @@ class TradingSimulator:
         self.db.add(operation)
         
         self.db.commit()
+        if self.on_fill is not None:
+            self.on_fill(operation)
         return operation
     
+    def execute_orders(self, account_id: int, orders: list):
+        """
+        Ejecutar un lote de órdenes de compra y venta en una sola transacción
+        
+        La cuenta y las posiciones afectadas se bloquean y leen una sola vez; el lote se
+        valida completo en orden (las ventas liberan saldo para las compras siguientes)
+        y, si alguna orden no es válida, no se aplica ninguna. Las operaciones y los
+        cambios de posición se escriben en un único flush y un único commit.
+        
+        Parámetros:
+        - account_id: Id de la cuenta de simulación
+        - orders: Lista de diccionarios {'asset_id', 'side' ('buy'/'sell'), 'quantity', 'price'}
+        
+        Retorna:
+        - Lista de operaciones creadas, en el orden del lote
+        """
+        account = self.db.query(models.SimulationAccount).filter(
+            models.SimulationAccount.id == account_id
+        ).with_for_update().first()
+        
+        if not account:
+            raise ValueError("Cuenta no encontrada")
+        
+        asset_ids = {order['asset_id'] for order in orders}
+        positions = {
+            position.asset_id: position
+            for position in self.db.query(models.SimulationPosition).filter(
+                models.SimulationPosition.account_id == account_id,
+                models.SimulationPosition.asset_id.in_(asset_ids)
+            ).with_for_update().all()
+        }
+        
+        # Validar todo el lote sobre copias del saldo y de las cantidades
+        balance = Decimal(account.current_balance)
+        holdings = {asset_id: (Decimal(position.quantity), Decimal(position.average_price))
+                    for asset_id, position in positions.items()}
+        validated = []
+        for i, order in enumerate(orders):
+            side = order.get('side')
+            quantity = _order_decimal(i, order, 'quantity')
+            price = _order_decimal(i, order, 'price')
+            asset_id = order['asset_id']
+            if side not in ('buy', 'sell'):
+                raise ValueError(f"Orden {i}: tipo de operación no válido ({side})")
+            if quantity <= 0 or price <= 0:
+                raise ValueError(f"Orden {i}: cantidad y precio deben ser positivos")
+            
+            held, average_price = holdings.get(asset_id, (Decimal(0), Decimal(0)))
+            if side == 'buy':
+                total_cost = quantity * price
+                if balance < total_cost:
+                    raise ValueError(f"Orden {i}: saldo insuficiente")
+                balance -= total_cost
+                holdings[asset_id] = (held + quantity, (held * average_price + total_cost) / (held + quantity))
+            else:
+                if held < quantity:
+                    raise ValueError(f"Orden {i}: no hay suficiente posición para vender")
+                balance += quantity * price
+                holdings[asset_id] = (held - quantity, average_price)
+            validated.append((asset_id, side, quantity, price))
+        
+        # Aplicar el resultado del lote
+        now = datetime.utcnow()
+        account.current_balance = balance
+        for asset_id, (quantity, average_price) in holdings.items():
+            position = positions.get(asset_id)
+            if quantity == 0:
+                if position is not None:
+                    self.db.delete(position)
+            elif position is None:
+                self.db.add(models.SimulationPosition(
+                    account_id=account_id,
+                    asset_id=asset_id,
+                    quantity=quantity,
+                    average_price=average_price,
+                    updated_at=now
+                ))
+            elif position.quantity != quantity or position.average_price != average_price:
+                # Una compra y una venta del mismo tamaño no cambian la cantidad, pero sí el precio medio
+                position.quantity = quantity
+                position.average_price = average_price
+                position.updated_at = now
+        
+        operations = [
+            models.SimulationOperation(
+                account_id=account_id,
+                asset_id=asset_id,
+                operation_type=side,
+                quantity=quantity,
+                price=price,
+                timestamp=now
+            )
+            for asset_id, side, quantity, price in validated
+        ]
+        self.db.add_all(operations)
+        
+        self.db.commit()
+        if self.on_fill is not None:
+            for operation in operations:
+                self.on_fill(operation)
+        return operations
+    
     def execute_trade_based_on_prediction(self, account_id: int, prediction: dict):
         """
         Ejecutar una operación basada en una predicción
@@ -229,8 +354,17 @@ class TradingSimulator:
         else:  # mantener
             return {"message": "Mantener posición actual"}
     
-    def get_account_performance(self, account_id: int):
-        """Calcular el rendimiento de una cuenta de simulación"""
+    def get_account_performance(self, account_id: int, price_source: str = 'last_fill'):
+        """
+        Calcular el rendimiento de una cuenta de simulación
+        
+        Las posiciones se valoran con una sola consulta, al precio de la última operación
+        de la cuenta en cada activo ('last_fill') o al último cierre guardado en
+        datos_mercado ('market', con la última operación como respaldo).
+        """
+        if price_source not in ('last_fill', 'market'):
+            raise ValueError(f"Origen de precios no soportado: {price_source}")
+        
         account = self.db.query(models.SimulationAccount).filter(
             models.SimulationAccount.id == account_id
         ).first()
@@ -238,37 +372,35 @@ class TradingSimulator:
         if not account:
             return None
         
-        # Calcular el valor actual del portafolio
-        positions = self.get_account_positions(account_id)
-        portfolio_value = account.current_balance
-        
-        for position in positions:
-            # Obtener el precio actual del activo (en una implementación real, esto se obtendría de la API)
-            # Por ahora, usamos el último precio de la operación
-            last_operation = self.db.query(models.SimulationOperation).filter(
-                models.SimulationOperation.account_id == account_id,
-                models.SimulationOperation.asset_id == position.asset_id
-            ).order_by(models.SimulationOperation.timestamp.desc()).first()
-            
-            if last_operation:
-                current_price = last_operation.price
-                position_value = position.quantity * current_price
-                portfolio_value += position_value
-        
-        # Calcular rendimiento
+        return self._performance_summary(account, self._portfolio_value(account, price_source), price_source)
+    
+    def _portfolio_value(self, account, price_source='last_fill'):
+        """Saldo más el valor de las posiciones de la cuenta (una sola consulta de valoración)"""
+        market_data_model = models.MarketData if price_source == 'market' else None
+        positions_total, _ = positions_value(self.db, account.id, models.SimulationPosition,
+                                             models.SimulationOperation, market_data_model)
+        return account.current_balance + positions_total
+    
+    def _performance_summary(self, account, portfolio_value, price_source):
+        """Rendimiento de una cuenta a partir de un valor de portafolio ya calculado"""
         total_return = (portfolio_value - account.initial_balance) / account.initial_balance * 100
         
         return {
-            "account_id": account_id,
+            "account_id": account.id,
             "initial_balance": float(account.initial_balance),
             "current_balance": float(account.current_balance),
             "portfolio_value": float(portfolio_value),
-            "total_return": float(total_return)
+            "total_return": float(total_return),
+            "price_source": price_source
         }
     
-    def simulate_trading_period(self, account_id: int, symbol: str, asset_type: str, model_type: str, days: int = 30):
+    def simulate_trading_period(self, account_id: int, symbol: str, asset_type: str, model_type: str, days: int = 30,
+                                checkpoint=None):
         """
         Simular un período de trading automático basado en predicciones diarias
+        
+        checkpoint es una función opcional llamada antes de cada día simulado (puede lanzar
+        una excepción para cancelar la simulación)
         """
         from .prediction_model import TradingPredictor
         
@@ -305,8 +437,14 @@ class TradingSimulator:
         
         # Ejecutar simulación para cada día
         simulation_results = []
+        # Valoración al precio de la última operación: solo cambia cuando se opera
+        portfolio_value = self._portfolio_value(account)
+        portfolio_values = [float(portfolio_value)]
+        trade_types, trade_prices = [], []
         
         for i in range(len(data)):
+            if checkpoint is not None:
+                checkpoint()
             date = data.index[i]
             current_price = data['close'].iloc[i]
             
@@ -324,9 +462,15 @@ class TradingSimulator:
                 "prediction": prediction,
                 "operation_result": result
             })
-        
-        # Calcular rendimiento final
-        performance = self.get_account_performance(account_id)
+            if "operation_id" in result:
+                trade_types.append("buy" if prediction['recommendation'] == 'comprar' else "sell")
+                trade_prices.append(prediction['current_price'])
+                portfolio_value = self._portfolio_value(account)
+            portfolio_values.append(float(portfolio_value))
+        
+        # Rendimiento final con la última valoración (sin volver a consultar)
+        performance = self._performance_summary(account, portfolio_value, 'last_fill')
+        performance["metrics"] = compute_performance_metrics(portfolio_values, trade_types, trade_prices)
         
         return {
             "account_id": account_id,
@@ -0,0 +1,79 @@
+# single_flight.py
+import threading
+
+
+class _Call:
+    """Llamada en curso para una clave: los demás hilos esperan a su resultado"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicación de llamadas concurrentes por clave
+
+    Si llega una llamada para una clave que ya se está ejecutando, no se repite el
+    trabajo: se espera a la llamada en curso y se comparte su resultado (o su excepción).
+    Se usa para que varias peticiones del mismo símbolo no entrenen ni descarguen a la vez.
+    """
+
+    def __init__(self):
+        self._calls = {}  # {key: _Call}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def do(self, key, fn):
+        """
+        Ejecutar fn() una sola vez para todas las llamadas concurrentes con la misma clave
+
+        Retorna:
+        - (resultado, coalesced): coalesced es True si se reutilizó la ejecución de otro hilo
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "in_flight": len(self._calls),
+            }
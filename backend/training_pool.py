@@ -0,0 +1,100 @@
+# training_pool.py
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Variables de entorno que controlan los hilos de las librerías numéricas
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS']
+
+
+def _init_worker(threads_per_worker):
+    """Fijar el número de hilos de cada proceso para evitar la sobresuscripción de CPU"""
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads_per_worker)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(threads_per_worker)
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads_per_worker)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _train_job(symbol, asset_type, model_type, n_jobs, train_kwargs):
+    """Entrenar un único modelo y devolver su entrada del informe (nunca lanza excepciones)"""
+    from prediction_model import TradingPredictor
+
+    start = time.perf_counter()
+    report = {
+        'symbol': symbol,
+        'asset_type': asset_type,
+        'model_type': model_type,
+        'status': 'ok',
+        'loss': None,
+        'seconds': None,
+        'error': None,
+        'worker_pid': os.getpid(),
+    }
+    try:
+        predictor = TradingPredictor(model_type=model_type, n_jobs=n_jobs)
+        loss = predictor.train(symbol, asset_type, **train_kwargs)
+        report['loss'] = float(loss) if loss is not None else None
+        logging.info(f"Modelo {model_type} entrenado para {symbol}")
+    except Exception as e:
+        logging.error(f"Error al entrenar modelo {model_type} para {symbol}: {e}")
+        report['status'] = 'error'
+        report['error'] = str(e)
+    report['seconds'] = time.perf_counter() - start
+    return report
+
+
+def train_models_parallel(assets, model_types=('lstm', 'random_forest', 'xgboost'),
+                          max_workers=None, threads_per_worker=None, **train_kwargs):
+    """
+    Entrenar todos los pares (activo, modelo) en un pool de procesos
+
+    Parámetros:
+    - assets: Lista de diccionarios {'symbol': ..., 'type': 'stock'|'crypto'}
+    - model_types: Tipos de modelo a entrenar para cada activo
+    - max_workers: Número de procesos (por defecto, min(trabajos, CPUs))
+    - threads_per_worker: Hilos por proceso para TF, XGBoost y sklearn (por defecto, CPUs / procesos)
+    - train_kwargs: Argumentos adicionales para TradingPredictor.train (epochs, look_back, ...)
+
+    Retorna:
+    - Lista con un informe por trabajo (estado, pérdida, segundos, error), en el orden de entrada
+    """
+    jobs = [(asset['symbol'], asset['type'], model_type) for asset in assets for model_type in model_types]
+    if not jobs:
+        return []
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = max_workers or min(len(jobs), cpu_count)
+    threads_per_worker = threads_per_worker or max(1, cpu_count // max_workers)
+    logging.info(f"Entrenando {len(jobs)} modelos con {max_workers} procesos x {threads_per_worker} hilos")
+
+    reports = {}
+    # 'spawn' evita heredar el estado de TensorFlow del proceso padre
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                             initializer=_init_worker, initargs=(threads_per_worker,)) as pool:
+        futures = {
+            pool.submit(_train_job, symbol, asset_type, model_type, threads_per_worker, train_kwargs): (symbol, asset_type, model_type)
+            for symbol, asset_type, model_type in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                reports[job] = future.result()
+            except Exception as e:
+                # Por ejemplo, un proceso que muere: el resto del lote continúa
+                symbol, asset_type, model_type = job
+                logging.error(f"El trabajo {job} terminó de forma inesperada: {e}")
+                reports[job] = {'symbol': symbol, 'asset_type': asset_type, 'model_type': model_type,
+                                'status': 'error', 'loss': None, 'seconds': None,
+                                'error': str(e), 'worker_pid': None}
+
+    return [reports[job] for job in jobs]
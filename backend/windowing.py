@@ -0,0 +1,92 @@
+# windowing.py
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def sliding_windows(series, look_back):
+    """
+    Construir las secuencias (X, y) de una serie sin copiar datos
+
+    Parámetros:
+    - series: Array 1-D (o columna (n, 1)) con la serie ya escalada
+    - look_back: Longitud de cada ventana
+
+    Retorna:
+    - X: Vista de solo lectura de forma (n - look_back, look_back), X[i] = series[i:i+look_back]
+    - y: Vista desplazada de forma (n - look_back,), y[i] = series[i+look_back]
+    """
+    series = np.asarray(series)
+    if series.ndim == 2:
+        series = series[:, 0]
+    if len(series) <= look_back:
+        return np.empty((0, look_back), dtype=series.dtype), np.empty((0,), dtype=series.dtype)
+
+    # sliding_window_view ya devuelve una vista de solo lectura
+    X = sliding_window_view(series, look_back)[:-1]
+    y = series[look_back:]
+    y.flags.writeable = False
+    return X, y
+
+
+def sliding_windows_loop(series, look_back):
+    """Versión original con bucle de Python (se mantiene como referencia para las comparativas)"""
+    series = np.asarray(series).reshape(-1, 1)
+    X, y = [], []
+    for i in range(len(series) - look_back):
+        X.append(series[i:i+look_back, 0])
+        y.append(series[i+look_back, 0])
+    return np.array(X), np.array(y)
+
+
+# Tamaño máximo de las ventanas que window_dataset guarda en memoria con cache()
+DATASET_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def window_dataset(series, look_back, batch_size=32, start=0, stop=None, shuffle=False, seed=42, cache=True):
+    """
+    tf.data.Dataset de pares (ventana, siguiente valor) construido sobre la serie 1-D
+
+    Equivale a sliding_windows(series, look_back)[start:stop] con la forma (n, look_back, 1)
+    que espera el LSTM, pero las ventanas se generan lote a lote: en memoria solo están
+    la serie y los índices de inicio (O(n)) en lugar del tensor de ventanas (O(n·look_back)).
+    Cada lote se obtiene con un único tf.gather de (lote, look_back) índices, mucho más
+    rápido que tf.keras.utils.timeseries_dataset_from_array, que genera ventana a ventana.
+
+    Parámetros:
+    - series: Array 1-D (o columna (n, 1)) con la serie ya escalada
+    - look_back: Longitud de cada ventana
+    - batch_size: Tamaño de los lotes
+    - start, stop: Rango de ventanas a incluir (índices de sliding_windows)
+    - shuffle: Barajar el orden de las ventanas en cada época
+    - seed: Semilla del barajado
+    - cache: Guardar en memoria los lotes tras la primera época, solo si ocupan menos de
+             DATASET_CACHE_MAX_BYTES y no se baraja; una ruta de fichero guarda la caché en disco
+
+    Retorna:
+    - (dataset, número de ventanas)
+    """
+    import tensorflow as tf
+
+    series = np.asarray(series, dtype=np.float32)
+    if series.ndim == 2:
+        series = series[:, 0]
+    total = max(len(series) - look_back, 0)
+    stop = total if stop is None else min(stop, total)
+    count = max(stop - start, 0)
+
+    # La ventana i es series[i:i+look_back] y su objetivo series[i+look_back]
+    values = tf.constant(series)
+    offsets = tf.range(look_back, dtype=tf.int64)
+
+    def windows(starts):
+        return tf.gather(values, starts[:, tf.newaxis] + offsets)[..., tf.newaxis], tf.gather(values, starts + look_back)
+
+    dataset = tf.data.Dataset.from_tensor_slices(np.arange(start, start + count, dtype=np.int64))
+    if shuffle and count:
+        dataset = dataset.shuffle(count, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(windows, num_parallel_calls=tf.data.AUTOTUNE)
+    if isinstance(cache, str):
+        dataset = dataset.cache(cache)
+    elif cache and not shuffle and count * (look_back + 1) * series.itemsize <= DATASET_CACHE_MAX_BYTES:
+        dataset = dataset.cache()
+    return dataset.prefetch(tf.data.AUTOTUNE), count